@@ -66,8 +66,10 @@ def main():
             # Get answer
             print("\n🤖 PathWay: ", end="", flush=True)
 
-            result = rag.answer_question(question, query_type=query_type)
-            print(result['answer'])
+            result = rag.answer_question(question, query_type=query_type, stream=True)
+            for chunk in result['answer']:
+                print(chunk, end="", flush=True)
+            print()
 
             # Show sources
             if result.get('sources'):
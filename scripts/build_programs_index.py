@@ -101,7 +101,12 @@ def build_programs_index():
 
     # Generate embeddings
     print(f"\n4. Generating embeddings...")
-    embeddings = model.encode(all_texts, show_progress_bar=True, batch_size=32)
+    # Unit-norm float32: SimpleVectorStore still converts it to float16 on
+    # first load, but skips renormalizing rows that are already unit length
+    embeddings = model.encode(
+        all_texts, show_progress_bar=True, batch_size=32,
+        convert_to_numpy=True, normalize_embeddings=True
+    ).astype('float32', copy=False)
     print(f"   ✓ Generated {embeddings.shape} embeddings")
 
     # Save index
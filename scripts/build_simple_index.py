@@ -76,7 +76,11 @@ def build_culpa_index_simple():
 
     # Generate embeddings
     print(f"\n3. Generating embeddings for {len(texts)} professors...")
-    embeddings = model.encode(texts, show_progress_bar=True)
+    # Unit-norm float32: SimpleVectorStore still converts it to float16 on
+    # first load, but skips renormalizing rows that are already unit length
+    embeddings = model.encode(
+        texts, show_progress_bar=True, convert_to_numpy=True, normalize_embeddings=True
+    ).astype('float32', copy=False)
     print(f"   ✓ Generated {embeddings.shape} embeddings")
 
     # Save simple index
@@ -2,15 +2,21 @@
 FastAPI application for PathWay RAG system.
 """
 import asyncio
+import functools
+import hashlib
 import inspect
 import logging
 import json
 import os
 import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from pydantic import TypeAdapter
+from typing import List, Optional
 
 from dotenv import load_dotenv
 
@@ -23,7 +29,7 @@ from .models import (
 )
 from ..rag.embeddings import EmbeddingGenerator
 from ..rag.vector_store import create_vector_store
-from ..rag.retriever import RAGRetriever, ProfessorRatingsRetriever
+from ..rag.retriever import RAGRetriever, ProfessorRatingsRetriever, SemanticResponseCache
 from ..rag.llm_interface import create_llm_interface, PromptTemplate
 
 # Load '.env' if provided
@@ -33,11 +39,23 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Initialize components before the app starts serving
+    """
+    await run_endpoint(_startup_event, skip_system_check=True)
+    yield
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="PathWay API",
     description="LLM-Powered Degree Advisor with RAG",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -53,10 +71,30 @@ app.add_middleware(
 embedder: Optional[EmbeddingGenerator] = None
 requirements_retriever: Optional[RAGRetriever] = None
 professor_retriever: Optional[ProfessorRatingsRetriever] = None
+semantic_cache: Optional[SemanticResponseCache] = None
 llm_interface = None
 
 SYSTEM_NOT_READY = "System is still initializing. Please try again in a moment."
 
+# LLM planning output is untrusted, so courses are validated here in one
+# pass; everything assembled from it afterwards uses model_construct
+_COURSE_LIST_ADAPTER = TypeAdapter(List[Course])
+
+# JSON object containing a "semesters" key in a planning response
+_PLAN_JSON_RE = re.compile(r'\{[\s\S]*"semesters"[\s\S]*\}')
+
+# Full /plan responses keyed by the normalized request. Retrieval for a
+# (program, catalog_year) pair is cached separately in
+# _get_requirements_and_profs. Both expire after PLAN_CACHE_TTL_SECONDS
+# (retrieval at the end of each TTL window); the index is rebuilt
+# offline, so call clear_plan_caches after re-importing the catalog
+PLAN_CACHE_SIZE = 1024
+PLAN_CACHE_TTL_SECONDS = 3600
+_plan_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# Seconds a /ask answer stays in the semantic cache
+SEMANTIC_CACHE_TTL_SECONDS = 3600
+
 
 def _system_is_ready() -> bool:
     """
@@ -114,7 +152,7 @@ async def run_endpoint(
 
     except Exception as e:
         logger.error(f"Error in endpoint {endpoint.__name__}: {e}")
-        if os.environ["DEBUG"]:
+        if os.environ.get("DEBUG"):
             raise e
         raise HTTPException(
             status_code=500,
@@ -126,7 +164,7 @@ async def _startup_event(*args, **kwargs) -> None:
     """
     Initialize components on startup
     """
-    global embedder, requirements_retriever, professor_retriever, llm_interface
+    global embedder, requirements_retriever, professor_retriever, llm_interface, semantic_cache
     logger.info("Initializing PathWay RAG system...")
 
     # Load configuration
@@ -158,29 +196,38 @@ async def _startup_event(*args, **kwargs) -> None:
         OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
         LLM_MODEL = os.environ["LLM_MODEL"]
 
-    if os.environ["DEBUG"]:
+    if os.environ.get("DEBUG"):
         # WARNING: very bad to reflect sensitive config to logs, do not
         # run with debug on in production without removing this
         logging.info(f"Gemini api key: {GEMINI_API_KEY}")
         logging.info(f"OpenAI api key: {OPENAI_API_KEY}")
         logging.info(f"Anthropic api key: {ANTHROPIC_API_KEY}")
 
-    # Initialize embedder
+    # Model loading, vector store connections and the LLM client are
+    # independent, so initialize them concurrently
     logger.info(f"Loading embedding model: {EMBEDDING_MODEL}")
-    embedder = EmbeddingGenerator(EMBEDDING_MODEL)
-
-    # Initialize vector stores
     logger.info("Connecting to vector stores...")
-    requirements_store = create_vector_store(
-        store_type=VECTOR_DB_TYPE,
-        collection_name=COLLECTION_NAME_REQUIREMENTS,
-        persist_directory=VECTOR_DB_PATH
-    )
-
-    professor_store = create_vector_store(
-        store_type=VECTOR_DB_TYPE,
-        collection_name=COLLECTION_NAME_PROFESSORS,
-        persist_directory=VECTOR_DB_PATH
+    logger.info(f"Initializing LLM: {LLM_MODEL}")
+    # TODO: do not default to Gemini here?
+    embedder, requirements_store, professor_store, llm_interface = await asyncio.gather(
+        asyncio.to_thread(EmbeddingGenerator, EMBEDDING_MODEL),
+        asyncio.to_thread(
+            create_vector_store,
+            store_type=VECTOR_DB_TYPE,
+            collection_name=COLLECTION_NAME_REQUIREMENTS,
+            persist_directory=VECTOR_DB_PATH
+        ),
+        asyncio.to_thread(
+            create_vector_store,
+            store_type=VECTOR_DB_TYPE,
+            collection_name=COLLECTION_NAME_PROFESSORS,
+            persist_directory=VECTOR_DB_PATH
+        ),
+        asyncio.to_thread(
+            create_llm_interface,
+            provider="gemini",
+            api_key=GEMINI_API_KEY,
+        ),
     )
 
     # Initialize retrievers
@@ -195,22 +242,15 @@ async def _startup_event(*args, **kwargs) -> None:
         vector_store=professor_store
     )
 
-    # Initialize LLM
-    # TODO: do not default to Gemini here?
-    logger.info(f"Initializing LLM: {LLM_MODEL}")
-    llm_interface = create_llm_interface(
-        provider="gemini",
-        api_key=GEMINI_API_KEY,
+    # Shares the retrievers' embedder, so no extra model is loaded
+    semantic_cache = SemanticResponseCache(
+        embedder=requirements_retriever.embedder,
+        ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS
     )
 
     logger.info("PathWay RAG system initialized successfully!")
 
 
-@app.on_event("startup")
-async def startup_event():
-    return await run_endpoint(_startup_event, skip_system_check=True)
-
-
 @app.get("/", response_model=dict)
 async def root():
     """Root endpoint."""
@@ -281,6 +321,26 @@ async def info_retrievers():
     return await run_endpoint(_info_retrievers)
 
 
+def _semantic_cache_namespace(
+    user_profile: Optional[dict],
+    retrieved_docs: List[dict]
+) -> str:
+    """
+    Semantic cache namespace for an /ask answer: the user profile plus a
+    hash of the retrieved document ids. Near-identical questions about
+    different courses retrieve different documents, so they cannot share
+    an answer.
+
+    :return: Namespace string
+    :rtype: str
+    """
+    doc_ids = json.dumps(
+        [doc.get('id') or doc['text'] for doc in retrieved_docs], default=str
+    )
+    digest = hashlib.blake2b(doc_ids.encode(), digest_size=16).hexdigest()
+    return f"{json.dumps(user_profile, sort_keys=True, default=str)}|{digest}"
+
+
 async def _ask_question(request: QuestionRequest, *args, **kwargs):
     """
     Answer a question about degree requirements.
@@ -296,7 +356,7 @@ async def _ask_question(request: QuestionRequest, *args, **kwargs):
     # Build user profile for filtering if provided
     user_profile_dict = None
     if request.user_profile:
-        user_profile_dict = request.user_profile.dict()
+        user_profile_dict = request.user_profile.model_dump()
 
     # Retrieve relevant documents
     retrieval_result = requirements_retriever.retrieve_with_context(
@@ -308,13 +368,13 @@ async def _ask_question(request: QuestionRequest, *args, **kwargs):
     retrieved_docs = retrieval_result['results']
 
     if not retrieved_docs:
-        return QuestionResponse(
+        return QuestionResponse.model_construct(
             question=request.question,
             answer="I couldn't find relevant information in the knowledge base to answer your question. Please contact your academic advisor for assistance.",
             sources=[]
         )
 
-    # Format context for LLM
+    # Format context for LLM (the retriever caches this per document set)
     context = requirements_retriever.format_context_for_llm(retrieved_docs)
 
     # Build prompt
@@ -324,12 +384,19 @@ async def _ask_question(request: QuestionRequest, *args, **kwargs):
         user_profile=user_profile_dict
     )
 
-    # Generate answer
-    answer = llm_interface.generate(messages)
-
-    # Format sources
+    # Generate answer, unless a paraphrase of this question under the
+    # same profile was already answered from the same documents
+    cache_namespace = _semantic_cache_namespace(user_profile_dict, retrieved_docs)
+    answer = semantic_cache.lookup(request.question, cache_namespace)
+    if answer is None:
+        answer = await llm_interface.agenerate(messages)
+        if not answer.startswith("Error:"):
+            semantic_cache.add(request.question, answer, cache_namespace)
+
+    # Format sources. Request models are validated at ingress and the
+    # remaining fields come from our own index, so skip re-validation
     sources = [
-        Source(
+        Source.model_construct(
             text=doc['text'][:200] + "..." if len(doc['text']) > 200 else doc['text'],
             source=doc['metadata'].get('source', 'Unknown'),
             program=doc['metadata'].get('program'),
@@ -339,7 +406,7 @@ async def _ask_question(request: QuestionRequest, *args, **kwargs):
         for doc in retrieved_docs[:5]
     ]
 
-    return QuestionResponse(
+    return QuestionResponse.model_construct(
         question=request.question,
         answer=answer,
         sources=sources
@@ -362,7 +429,7 @@ def parse_planning_response(plan_text: str) -> tuple:
         Tuple of (semesters, notes, explanation)
     """
     # Try to extract JSON
-    json_match = re.search(r'\{[\s\S]*"semesters"[\s\S]*\}', plan_text)
+    json_match = _PLAN_JSON_RE.search(plan_text)
 
     if json_match:
         try:
@@ -371,11 +438,10 @@ def parse_planning_response(plan_text: str) -> tuple:
 
             semesters = []
             for sem_data in plan_data.get('semesters', []):
-                courses = [
-                    Course(**course_data)
-                    for course_data in sem_data.get('courses', [])
-                ]
-                semesters.append(Semester(
+                courses = _COURSE_LIST_ADAPTER.validate_python(
+                    sem_data.get('courses', [])
+                )
+                semesters.append(Semester.model_construct(
                     name=sem_data['name'],
                     courses=courses,
                     total_credits=sum(c.credits for c in courses)
@@ -395,28 +461,27 @@ def parse_planning_response(plan_text: str) -> tuple:
     return [], ["Unable to generate structured plan. See explanation."], plan_text
 
 
-async def _create_plan(request: PlanRequest, *args, **kwargs):
+@functools.lru_cache(maxsize=128)
+def _get_requirements_and_profs(program: str, catalog_year: int, ttl_window: int = 0) -> tuple:
     """
-    Create a personalized degree plan.
-
-    Args:
-        request: Planning request with user profile
-
-    Returns:
-        Semester-by-semester course plan with professor recommendations
+    Retrieve degree requirements and professor ratings for a program.
+    These only depend on (program, catalog_year), so they are shared by
+    every plan request for the same program.
+
+    :param ttl_window: Only part of the cache key; pass the current
+        PLAN_CACHE_TTL_SECONDS window (see _plan_ttl_window) so cached
+        retrievals expire with plans
+    :return: Tuple of (requirements context, professor info)
+    :rtype: tuple
     """
-    logger.info(f"Creating plan for: {request.user_profile.program}")
-
-    user_profile_dict = request.user_profile.dict()
-
     # Retrieve degree requirements
-    req_query = f"degree requirements and course list for {request.user_profile.program}"
+    req_query = f"degree requirements and course list for {program}"
     req_docs = requirements_retriever.retrieve(
         query=req_query,
         k=10,
         filter_dict={
-            'program': request.user_profile.program,
-            'catalog_year': request.user_profile.catalog_year
+            'program': program,
+            'catalog_year': catalog_year
         }
     )
 
@@ -426,13 +491,14 @@ async def _create_plan(request: PlanRequest, *args, **kwargs):
     # Extract course codes from requirements
     course_codes = set()
     for doc in req_docs:
-        codes = doc['metadata'].get('course_codes', [])
-        course_codes.update(codes)
+        course_codes.update(doc['metadata'].get('course_codes', ()))
 
-    # Get professor info
+    # Get professor info, looking all courses up in one batch
     prof_info_parts = []
-    for course_code in list(course_codes)[:20]:  # Limit to avoid too long context
-        profs = professor_retriever.get_professors_for_course(course_code, k=3)
+    course_codes = list(course_codes)[:20]  # Limit to avoid too long context
+    profs_by_course = professor_retriever.get_professors_for_courses(course_codes, k=3)
+    for course_code in course_codes:
+        profs = profs_by_course[course_code]
         if profs:
             prof_info_parts.append(f"\n{course_code}:")
             for prof in profs:
@@ -440,6 +506,68 @@ async def _create_plan(request: PlanRequest, *args, **kwargs):
 
     professor_info = "\n".join(prof_info_parts) if prof_info_parts else "No professor rating data available."
 
+    return requirements_context, professor_info
+
+
+def _plan_ttl_window() -> int:
+    """Index of the current PLAN_CACHE_TTL_SECONDS window."""
+    return int(time.monotonic() // PLAN_CACHE_TTL_SECONDS)
+
+
+def _plan_cache_key(request: PlanRequest) -> str:
+    """Cache key for a plan request; completed course order is ignored."""
+    profile = request.user_profile.model_dump()
+    profile['completed_courses'] = sorted(profile['completed_courses'])
+    return json.dumps(
+        {"user_profile": profile, "num_semesters": request.num_semesters},
+        sort_keys=True,
+    )
+
+
+def clear_plan_caches() -> None:
+    """
+    Drop cached plans, requirement retrievals and /ask answers, e.g.
+    after a reindex.
+    """
+    _plan_cache.clear()
+    _get_requirements_and_profs.cache_clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+
+
+async def _create_plan(request: PlanRequest, *args, **kwargs):
+    """
+    Create a personalized degree plan.
+
+    Args:
+        request: Planning request with user profile
+
+    Returns:
+        Semester-by-semester course plan with professor recommendations
+    """
+    logger.info(f"Creating plan for: {request.user_profile.program}")
+
+    cache_key = _plan_cache_key(request)
+    cached = _plan_cache.get(cache_key)
+    if cached is not None:
+        expires_at, cached_response = cached
+        if expires_at > time.monotonic():
+            _plan_cache.move_to_end(cache_key)
+            logger.info("Returning cached plan")
+            return cached_response
+        del _plan_cache[cache_key]
+
+    user_profile_dict = request.user_profile.model_dump()
+
+    # Embedding and vector searches block, so a cache miss runs off the
+    # event loop
+    requirements_context, professor_info = await asyncio.to_thread(
+        _get_requirements_and_profs,
+        request.user_profile.program,
+        request.user_profile.catalog_year,
+        _plan_ttl_window(),
+    )
+
     # Build planning prompt
     messages = PromptTemplate.build_planning_prompt(
         user_profile=user_profile_dict,
@@ -448,18 +576,26 @@ async def _create_plan(request: PlanRequest, *args, **kwargs):
     )
 
     # Generate plan
-    plan_text = llm_interface.generate(messages, max_tokens=3000)
+    plan_text = await llm_interface.agenerate(messages, max_tokens=3000)
 
     # Parse JSON from response
     semesters, notes, explanation = parse_planning_response(plan_text)
 
-    return PlanResponse(
+    response = PlanResponse.model_construct(
         user_profile=request.user_profile,
         semesters=semesters,
         notes=notes,
         explanation=explanation
     )
 
+    # Only keep structured plans; failed generations should be retried
+    if semesters:
+        _plan_cache[cache_key] = (time.monotonic() + PLAN_CACHE_TTL_SECONDS, response)
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+    return response
+
 
 @app.post("/plan", response_model=PlanResponse)
 async def create_plan(request: PlanRequest):
@@ -478,11 +614,14 @@ async def _query_professors(request: ProfessorQueryRequest, *args, **kwargs):
     """
     result = {}
 
-    for course_code in request.course_codes:
-        profs = professor_retriever.get_professors_for_course(course_code, k=5)
+    # One batched embedding pass and concurrent searches, off the event loop
+    profs_by_course = await asyncio.to_thread(
+        professor_retriever.get_professors_for_courses, request.course_codes, 5
+    )
 
+    for course_code, profs in profs_by_course.items():
         result[course_code] = [
-            ProfessorRating(
+            ProfessorRating.model_construct(
                 course_code=p['metadata']['course_code'],
                 prof_name=p['metadata'].get('prof_name', p['metadata'].get('professor_name', 'Unknown Professor')),
                 rating=p['metadata']['rating'],
@@ -491,7 +630,7 @@ async def _query_professors(request: ProfessorQueryRequest, *args, **kwargs):
             for p in profs
         ]
 
-    return ProfessorQueryResponse(professors=result)
+    return ProfessorQueryResponse.model_construct(professors=result)
 
 
 @app.post("/professors", response_model=ProfessorQueryResponse)
@@ -502,4 +641,17 @@ async def query_professors(request: ProfessorQueryRequest):
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Multiple workers need the app as an import string. Each worker
+    # loads its own embedder and vector store handles, so keep this at
+    # half the cores; concurrency past the limit is rejected with a 503
+    # instead of queueing without bound
+    uvicorn.run(
+        "src.api.app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=max(1, (os.cpu_count() or 2) // 2),
+        limit_concurrency=64,
+        log_level="info",
+    )
@@ -4,15 +4,47 @@ Document processing module for extracting and chunking text from various sources
 import logging
 import os
 import re
+import sys
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pypdf
+import xxhash
 from bs4 import BeautifulSoup
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+COURSE_CODE_PATTERN = re.compile(r'\b[A-Z]{4}\s*\d{4}\b')
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s\.\,\;\:\-\(\)\[\]\/]')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _word_count(text: str) -> int:
+    """Default chunk length measure: whitespace-separated words."""
+    return len(text.split())
+
+
+def _course_codes_in(text: str) -> Tuple[str, ...]:
+    """
+    Sorted, de-duplicated course codes in text. Codes are interned so the
+    same code shared across chunks is a single string object. Not memoized:
+    chunk texts rarely repeat, so a cache keyed on them mostly holds
+    copies of the corpus.
+    """
+    codes = {
+        sys.intern(_WHITESPACE_RE.sub(' ', code))
+        for code in COURSE_CODE_PATTERN.findall(text)
+    }
+    return tuple(sorted(codes))
+
+
+def _chunk_id(text: str, metadata: Dict[str, Any]) -> str:
+    return f"{metadata.get('source', 'unknown')}_{xxhash.xxh3_64_hexdigest(text.encode())}"
+
 
 class DocumentChunk:
     """Represents a chunk of text with metadata."""
@@ -25,7 +57,9 @@ class DocumentChunk:
     ):
         self.text = text
         self.metadata = metadata
-        self.chunk_id = chunk_id or f"{metadata.get('source', 'unknown')}_{hash(text)}"
+        # xxh3 is deterministic across processes (unlike the salted
+        # built-in hash), so re-indexing yields the same chunk IDs
+        self.chunk_id = chunk_id or _chunk_id(text, metadata)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -35,12 +69,80 @@ class DocumentChunk:
         }
 
 
+@dataclass
+class ChunkBatch:
+    """
+    Column-oriented batch of chunks: parallel ids, texts and metadata.
+
+    The indexer hands these columns straight to the embedder and vector
+    store, instead of re-scanning a list of DocumentChunk objects once per
+    field. Iterating yields DocumentChunk views for row-wise callers.
+    """
+
+    ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=object))
+    texts: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], metadatas: List[Dict[str, Any]]) -> "ChunkBatch":
+        """Build a batch, deriving each chunk ID from its text and source."""
+        ids = np.empty(len(texts), dtype=object)
+        ids[:] = [_chunk_id(text, metadata) for text, metadata in zip(texts, metadatas)]
+        return cls(ids=ids, texts=texts, metadatas=metadatas)
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[DocumentChunk]) -> "ChunkBatch":
+        """Build a batch from DocumentChunk objects."""
+        chunks = list(chunks)
+        ids = np.empty(len(chunks), dtype=object)
+        ids[:] = [chunk.chunk_id for chunk in chunks]
+        return cls(
+            ids=ids,
+            texts=[chunk.text for chunk in chunks],
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
+
+    @classmethod
+    def concat(cls, batches: Iterable["ChunkBatch"]) -> "ChunkBatch":
+        """Concatenate batches in order."""
+        batches = list(batches)
+        if not batches:
+            return cls()
+        return cls(
+            ids=np.concatenate([batch.ids for batch in batches]),
+            texts=[text for batch in batches for text in batch.texts],
+            metadatas=[metadata for batch in batches for metadata in batch.metadatas]
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[DocumentChunk]:
+        for chunk_id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+            yield DocumentChunk(text=text, metadata=metadata, chunk_id=chunk_id)
+
+
 class DocumentProcessor:
     """Process documents and split them into chunks."""
 
-    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 100):
+    def __init__(
+        self,
+        chunk_size: int = 600,
+        chunk_overlap: int = 100,
+        length_function: Optional[Callable[[str], int]] = None
+    ):
+        """
+        Args:
+            chunk_size: Maximum chunk length
+            chunk_overlap: Length carried over between consecutive chunks
+            length_function: Measures text length for chunk_size and
+                chunk_overlap. Defaults to a whitespace word count; pass
+                EmbeddingGenerator.count_tokens to size chunks in model
+                tokens so they are not truncated at max_seq_length
+        """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.length_function = length_function or _word_count
 
     def extract_from_pdf(self, pdf_path: str) -> str:
         """Extract text from a PDF file."""
@@ -54,7 +156,7 @@ class DocumentProcessor:
             return self.clean_text(text)
         except Exception as e:
             logger.error(f"Error extracting PDF {pdf_path}: {e}")
-            if os.environ["DEBUG"]:
+            if os.environ.get("DEBUG"):
                 raise e
             return ""
 
@@ -69,16 +171,16 @@ class DocumentProcessor:
             return self.clean_text(text)
         except Exception as e:
             logger.error(f"Error extracting HTML: {e}")
-            if os.environ["DEBUG"]:
+            if os.environ.get("DEBUG"):
                 raise e
             return ""
 
     def clean_text(self, text: str) -> str:
         """Clean and normalize text."""
         # Remove multiple spaces and newlines
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s\.\,\;\:\-\(\)\[\]\/]', '', text)
+        text = _SPECIAL_CHARS_RE.sub('', text)
         # Fix common PDF extraction issues
         text = text.replace('­', '')  # Remove soft hyphens
         return text.strip()
@@ -98,8 +200,25 @@ class DocumentProcessor:
         Returns:
             List of DocumentChunk objects
         """
+        return list(self.chunk_text_batch(text, metadata))
+
+    def chunk_text_batch(
+        self,
+        text: str,
+        metadata: Dict[str, Any]
+    ) -> ChunkBatch:
+        """
+        Split text into overlapping chunks, returned as a ChunkBatch.
+
+        Args:
+            text: The text to chunk
+            metadata: Metadata to attach to each chunk
+
+        Returns:
+            ChunkBatch of the chunks
+        """
         if not text:
-            return []
+            return ChunkBatch()
 
         # Split by sentences for better chunking
         sentences = self._split_into_sentences(text)
@@ -108,21 +227,17 @@ class DocumentProcessor:
         current_length = 0
 
         for sentence in sentences:
-            sentence_length = len(sentence.split())
+            sentence_length = self.length_function(sentence)
 
             if current_length + sentence_length > self.chunk_size and current_chunk:
                 # Create a chunk
-                chunk_text = ' '.join(current_chunk)
-                chunks.append(DocumentChunk(
-                    text=chunk_text,
-                    metadata=metadata.copy()
-                ))
+                chunks.append(' '.join(current_chunk))
 
                 # Start new chunk with overlap
                 overlap_words = []
                 overlap_length = 0
                 for s in reversed(current_chunk):
-                    s_len = len(s.split())
+                    s_len = self.length_function(s)
                     if overlap_length + s_len <= self.chunk_overlap:
                         overlap_words.insert(0, s)
                         overlap_length += s_len
@@ -137,19 +252,15 @@ class DocumentProcessor:
 
         # Add the last chunk
         if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append(DocumentChunk(
-                text=chunk_text,
-                metadata=metadata.copy()
-            ))
+            chunks.append(' '.join(current_chunk))
 
         logger.info(f"Created {len(chunks)} chunks from text")
-        return chunks
+        return ChunkBatch.from_texts(chunks, [metadata.copy() for _ in chunks])
 
     def _split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences."""
         # Simple sentence splitter
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        sentences = _SENTENCE_END_RE.split(text)
         return [s.strip() for s in sentences if s.strip()]
 
     def process_degree_requirement_doc(
@@ -159,7 +270,7 @@ class DocumentProcessor:
         degree: str,
         catalog_year: int,
         source_url: str = None
-    ) -> List[DocumentChunk]:
+    ) -> ChunkBatch:
         """
         Process a degree requirement document.
 
@@ -171,7 +282,7 @@ class DocumentProcessor:
             source_url: URL of the source document
 
         Returns:
-            List of DocumentChunk objects
+            ChunkBatch of the document's chunks
         """
         path = Path(file_path)
 
@@ -188,7 +299,7 @@ class DocumentProcessor:
             text = self.clean_text(text)
         else:
             logger.error(f"Unsupported file type: {path.suffix}")
-            return []
+            return ChunkBatch()
 
         # Create metadata
         metadata = {
@@ -201,23 +312,24 @@ class DocumentProcessor:
         }
 
         # Chunk the text
-        chunks = self.chunk_text(text, metadata)
+        chunks = self.chunk_text_batch(text, metadata)
 
         # Extract course codes if present
-        for chunk in chunks:
-            course_codes = self._extract_course_codes(chunk.text)
+        for chunk_text, chunk_metadata in zip(chunks.texts, chunks.metadatas):
+            course_codes = self._extract_course_codes(chunk_text)
             if course_codes:
-                chunk.metadata["course_codes"] = course_codes
+                chunk_metadata["course_codes"] = course_codes
 
         return chunks
 
-    def _extract_course_codes(self, text: str) -> List[str]:
-        """Extract course codes from text (e.g., COMS 4111, ENGI 6000)."""
-        pattern = r'\b[A-Z]{4}\s*\d{4}\b'
-        matches = re.findall(pattern, text)
-        # Normalize spacing
-        codes = [re.sub(r'\s+', ' ', code) for code in matches]
-        return list(set(codes))  # Remove duplicates
+    def _extract_course_codes(self, text: str) -> Tuple[str, ...]:
+        """
+        Extract course codes from text (e.g., COMS 4111, ENGI 6000).
+
+        Returns a sorted tuple of unique, spacing-normalized codes, interned
+        so chunks share one string per code. Not memoized.
+        """
+        return _course_codes_in(text)
 
 
 if __name__ == "__main__":
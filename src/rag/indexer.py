@@ -1,22 +1,47 @@
 """
 Indexing module for building and managing vector indices.
 """
+import csv
 import json
 import logging
+import queue
+import threading
 from typing import List, Dict, Any
 from pathlib import Path
 
-import pandas as pd
+from joblib import Parallel, delayed
 from tqdm import tqdm
 
-from .document_processor import DocumentProcessor, DocumentChunk
-from .embeddings import EmbeddingGenerator
+from .document_processor import ChunkBatch, DocumentProcessor, DocumentChunk
+from .embeddings import EmbeddingGenerator, create_embedding_generator
 from .vector_store import VectorStore, create_vector_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _process_degree_requirement_file(
+    processor: DocumentProcessor,
+    file_path: Path,
+    doc_info: Dict[str, Any]
+) -> ChunkBatch:
+    """Chunk one degree requirement file; runs in a joblib worker."""
+    try:
+        chunks = processor.process_degree_requirement_doc(
+            file_path=str(file_path),
+            program=doc_info.get("program", ""),
+            degree=doc_info.get("degree", ""),
+            catalog_year=doc_info.get("catalog_year"),
+            source_url=doc_info.get("source_url", "")
+        )
+        if not chunks:
+            logger.debug(f"No chunks produced for file: {file_path}")
+        return chunks
+    except Exception as e:
+        logger.exception(f"Error processing {file_path}: {e}")
+        return ChunkBatch()
+
+
 class DocumentIndexer:
     """
     Indexer for processing documents and building vector indices.
@@ -26,7 +51,8 @@ class DocumentIndexer:
         self,
         document_processor: DocumentProcessor,
         embedder: EmbeddingGenerator,
-        vector_store: VectorStore
+        vector_store: VectorStore,
+        add_chunk_size: int = 10_000
     ):
         """
         Initialize the indexer.
@@ -35,20 +61,52 @@ class DocumentIndexer:
             document_processor: Document processor instance
             embedder: Embedding generator instance
             vector_store: Vector store instance
+            add_chunk_size: Maximum documents embedded and written to the
+                vector store per step, bounding peak memory on large builds
         """
         self.processor = document_processor
         self.embedder = embedder
         self.vector_store = vector_store
+        self.add_chunk_size = add_chunk_size
         logger.info("Initialized DocumentIndexer")
 
+    def _encode_texts(self, texts: List[str], batch_size: int = 32):
+        """
+        Encode texts, running each distinct text through the model once.
+
+        Args:
+            texts: Texts to encode, possibly with duplicates
+            batch_size: Batch size for embedding generation
+
+        Returns:
+            Numpy array of embeddings aligned with texts
+        """
+        positions = {}
+        inverse = [positions.setdefault(text, len(positions)) for text in texts]
+        unique_texts = list(positions)
+
+        embeddings = self.embedder.encode_documents(unique_texts, batch_size=batch_size)
+        if len(unique_texts) == len(texts):
+            return embeddings
+
+        logger.info(f"Encoded {len(unique_texts)} unique texts for {len(texts)} chunks")
+        return embeddings[inverse]
+
     def index_degree_requirements(
         self,
         documents: List[Dict[str, Any]],
-        batch_size: int = 32
+        batch_size: int = 32,
+        stream_batch_size: int = 256,
+        n_jobs: int = -1
     ):
         """
         Index degree requirement documents.
 
+        Documents are parsed on a background thread while the calling
+        thread embeds and stores finished chunks, so parsing overlaps
+        with embedding and at most a few batches of chunks are held in
+        memory at once.
+
         Args:
             documents: List of document info dicts with keys:
                 - file_path: Path to document
@@ -57,13 +115,90 @@ class DocumentIndexer:
                 - catalog_year: Academic year
                 - source_url: Optional URL
             batch_size: Batch size for embedding generation
+            stream_batch_size: Number of chunks to accumulate before
+                embedding and adding them to the vector store
+            n_jobs: Worker processes for parsing and chunking files
+                (-1 uses all CPUs, 1 processes files in this process)
         """
         logger.info(f"Indexing {len(documents)} degree requirement documents...")
 
-        all_chunks = []
+        done = object()
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=2)
+        # Set when the consumer stops early, so the producer stops parsing
+        stop = threading.Event()
+
+        def produce():
+            chunk_iter = self._iter_degree_requirement_chunks(documents, n_jobs=n_jobs)
+            try:
+                for chunks in chunk_iter:
+                    if stop.is_set():
+                        break
+                    chunk_queue.put(chunks)
+            except Exception as e:
+                chunk_queue.put(e)
+            finally:
+                # Closing the generator shuts down the joblib workers
+                chunk_iter.close()
+                chunk_queue.put(done)
+
+        producer = threading.Thread(target=produce, name="document-processor", daemon=True)
+        producer.start()
+
+        pending: List[ChunkBatch] = []
+        pending_count = 0
+        total_chunks = 0
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                pending.append(item)
+                pending_count += len(item)
+                if pending_count >= stream_batch_size:
+                    self._index_chunks(ChunkBatch.concat(pending), batch_size=batch_size)
+                    total_chunks += pending_count
+                    pending = []
+                    pending_count = 0
+
+            if pending:
+                self._index_chunks(ChunkBatch.concat(pending), batch_size=batch_size)
+                total_chunks += pending_count
+        finally:
+            # On an indexing error the producer may be blocked on the full
+            # queue; keep draining it until the producer has exited
+            stop.set()
+            while producer.is_alive():
+                try:
+                    chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+        if not total_chunks:
+            logger.warning("No chunks generated from documents")
+            return
 
-        # Process all documents (support file or directory)
-        for doc_info in tqdm(documents, desc="Processing documents"):
+        logger.info(f"Indexed {total_chunks} chunks")
+        logger.info("Indexing complete!")
+
+    def _iter_degree_requirement_chunks(
+        self,
+        documents: List[Dict[str, Any]],
+        n_jobs: int = -1
+    ):
+        """
+        Process degree requirement documents (files or directories),
+        yielding the chunks of each file.
+
+        Files are parsed and chunked in parallel worker processes, so the
+        processor (including its length_function) must be picklable when
+        n_jobs != 1.
+        """
+        tasks = []
+        for doc_info in documents:
             raw_path = Path(doc_info["file_path"])
             file_paths = []
 
@@ -78,47 +213,52 @@ class DocumentIndexer:
                 logger.warning(f"No files found for path: {raw_path}")
                 continue
 
-            for fp in file_paths:
-                try:
-                    chunks = self.processor.process_degree_requirement_doc(
-                        file_path=str(fp),
-                        program=doc_info.get("program", ""),
-                        degree=doc_info.get("degree", ""),
-                        catalog_year=doc_info.get("catalog_year"),
-                        source_url=doc_info.get("source_url", "")
-                    )
-                    if chunks:
-                        all_chunks.extend(chunks)
-                    else:
-                        logger.debug(f"No chunks produced for file: {fp}")
-                except Exception as e:
-                    logger.exception(f"Error processing {fp}: {e}")
-
-        if not all_chunks:
-            logger.warning("No chunks generated from documents")
-            return
+            tasks.extend((fp, doc_info) for fp in file_paths)
 
-        logger.info(f"Generated {len(all_chunks)} chunks")
-
-        # Extract texts and metadata
-        texts = [chunk.text for chunk in all_chunks]
-        metadatas = [chunk.metadata for chunk in all_chunks]
-        ids = [chunk.chunk_id for chunk in all_chunks]
+        results = Parallel(n_jobs=n_jobs, backend="loky", return_as="generator")(
+            delayed(_process_degree_requirement_file)(self.processor, fp, doc_info)
+            for fp, doc_info in tasks
+        )
+        for chunks in tqdm(results, total=len(tasks), desc="Processing documents"):
+            if chunks:
+                yield chunks
 
-        # Generate embeddings in batches
-        logger.info("Generating embeddings...")
-        embeddings = self.embedder.encode_documents(texts, batch_size=batch_size)
+    def _index_chunks(self, chunks: ChunkBatch, batch_size: int = 32):
+        """
+        Embed chunks and add them to the vector store.
 
-        # Add to vector store
-        logger.info("Adding to vector store...")
-        self.vector_store.add_documents(
-            texts=texts,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
+        Args:
+            chunks: ChunkBatch to index
+            batch_size: Batch size for embedding generation
+        """
+        self._encode_and_add(
+            chunks.texts, chunks.metadatas, chunks.ids.tolist(), batch_size=batch_size
         )
 
-        logger.info("Indexing complete!")
+    def _encode_and_add(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        batch_size: int = 32
+    ):
+        """
+        Embed texts and add them to the vector store in slices of
+        add_chunk_size, so only one slice of embeddings is held at a time.
+        """
+        for start in range(0, len(texts), self.add_chunk_size):
+            end = start + self.add_chunk_size
+
+            logger.info(f"Generating embeddings for {len(texts[start:end])} documents...")
+            embeddings = self._encode_texts(texts[start:end], batch_size=batch_size)
+
+            logger.info("Adding to vector store...")
+            self.vector_store.add_documents(
+                texts=texts[start:end],
+                embeddings=embeddings,
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
 
     def index_professor_ratings(
         self,
@@ -141,32 +281,30 @@ class DocumentIndexer:
             with open(ratings_path, "r") as f:
                 ratings_data = json.load(f)
         elif ratings_path.suffix == ".csv":
-            df = pd.read_csv(ratings_path)
-            ratings_data = df.to_dict("records")
+            with open(ratings_path, "r", newline="") as f:
+                ratings_data = list(csv.DictReader(f))
         else:
             raise ValueError(f"Unsupported file format: {ratings_path.suffix}")
 
         logger.info(f"Loaded {len(ratings_data)} professor ratings")
 
-        # Format each rating as text for embedding
+        # Format each rating as text for embedding, building all three
+        # columns in a single pass over the rows
         texts = []
         metadatas = []
         ids = []
 
         for i, rating in enumerate(ratings_data):
             course_code = rating["course_code"]
-            prof_name = rating.get("prof_name", rating.get("name", ""))
+            prof_name = rating.get("prof_name") or rating.get("name") or ""
             rating_score = rating["rating"]
-            tags = rating.get("tags", "")
+            tags = rating.get("tags") or ""
 
-            # Create text representation
-            text = (
+            texts.append(
                 f"{course_code} taught by Professor {prof_name}. "
                 f"Rating: {rating_score}/5.0. "
                 f"Student feedback: {tags}"
             )
-
-            texts.append(text)
             metadatas.append({
                 "course_code": course_code,
                 "prof_name": prof_name,
@@ -176,18 +314,7 @@ class DocumentIndexer:
             })
             ids.append(f"prof_{course_code}_{prof_name}_{i}")
 
-        # Generate embeddings
-        logger.info("Generating embeddings...")
-        embeddings = self.embedder.encode_documents(texts, batch_size=batch_size)
-
-        # Add to vector store
-        logger.info("Adding to vector store...")
-        self.vector_store.add_documents(
-            texts=texts,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
-        )
+        self._encode_and_add(texts, metadatas, ids, batch_size=batch_size)
 
         logger.info("Professor ratings indexed!")
 
@@ -208,18 +335,7 @@ class DocumentIndexer:
 
         logger.info(f"Updating index with {len(new_chunks)} new chunks...")
 
-        texts = [chunk.text for chunk in new_chunks]
-        metadatas = [chunk.metadata for chunk in new_chunks]
-        ids = [chunk.chunk_id for chunk in new_chunks]
-
-        embeddings = self.embedder.encode_documents(texts, batch_size=batch_size)
-
-        self.vector_store.add_documents(
-            texts=texts,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
-        )
+        self._index_chunks(ChunkBatch.from_chunks(new_chunks), batch_size=batch_size)
 
         logger.info("Index updated!")
 
@@ -262,13 +378,31 @@ def build_indices_from_config(config_path: str):
         config = json.load(f)
 
     # Initialize components
-    processor = DocumentProcessor(
-        chunk_size=config.get("chunk_size", 600),
-        chunk_overlap=config.get("chunk_overlap", 100)
+    # "embedding_cache_dir" enables the persistent embedding cache so
+    # unchanged chunks are not re-embedded on rebuilds; "embedding_dtype"
+    # stores float16/int8 vectors instead of float32; "embedding_devices"
+    # spreads encoding over one worker process per listed device;
+    # "embedding_backend": "onnx" runs the encoder through ONNX Runtime;
+    # "embedding_compile" applies torch.compile to the PyTorch encoder
+    backend = config.get("embedding_backend", "sentence-transformers")
+    embedder_kwargs = {
+        "cache_dir": config.get("embedding_cache_dir"),
+        "dtype": config.get("embedding_dtype", "float32"),
+    }
+    if backend == "sentence-transformers":
+        embedder_kwargs["devices"] = config.get("embedding_devices")
+        embedder_kwargs["compile"] = config.get("embedding_compile", False)
+    embedder = create_embedding_generator(
+        model_name=config.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2"),
+        backend=backend,
+        **embedder_kwargs
     )
 
-    embedder = EmbeddingGenerator(
-        model_name=config.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
+    # "chunk_by_tokens" sizes chunks in model tokens rather than words
+    processor = DocumentProcessor(
+        chunk_size=config.get("chunk_size", 600),
+        chunk_overlap=config.get("chunk_overlap", 100),
+        length_function=embedder.count_tokens if config.get("chunk_by_tokens") else None
     )
 
     # Build degree requirements index
@@ -280,8 +414,13 @@ def build_indices_from_config(config_path: str):
             persist_directory=config["vector_db"]["persist_directory"]
         )
 
+        # Token-based chunking calls back into the (unpicklable) embedder,
+        # so it keeps document processing in this process
         req_indexer = DocumentIndexer(processor, embedder, req_store)
-        req_indexer.index_degree_requirements(req_config["documents"])
+        req_indexer.index_degree_requirements(
+            req_config["documents"],
+            n_jobs=1 if config.get("chunk_by_tokens") else config.get("n_jobs", -1)
+        )
 
     # Build professor ratings index
     if "professor_ratings" in config:
@@ -295,6 +434,7 @@ def build_indices_from_config(config_path: str):
         prof_indexer = DocumentIndexer(processor, embedder, prof_store)
         prof_indexer.index_professor_ratings(prof_config["ratings_file"])
 
+    embedder.close()
     logger.info("All indices built successfully!")
 
 
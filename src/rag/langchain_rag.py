@@ -4,47 +4,971 @@ Connects our vector databases with LangChain's RAG chain.
 """
 
 import os
+import asyncio
+import functools
+import hashlib
 import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import Document
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def _quantize_int8(embeddings: np.ndarray):
+    """
+    Symmetric per-row int8 quantization.
+
+    Returns:
+        Tuple of (int8 matrix, per-row float32 scales)
+    """
+    scale = np.max(np.abs(embeddings), axis=1, keepdims=True) / 127
+    scale[scale == 0] = 1
+    quantized = np.round(embeddings / scale).astype(np.int8)
+    return quantized, scale.squeeze(1).astype(np.float32)
+
+
+# Rows upcast to float32 per step in _matvec_f16. NumPy has no float16
+# BLAS kernel, so a direct float16 matvec is far slower than sgemv
+_F16_BLOCK_ROWS = 8192
+
+
+def _iter_f32_blocks(matrix: np.ndarray, block_rows: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yield (start, block) for consecutive row blocks of matrix as float32,
+    copied into one reused C-contiguous staging buffer rather than a new
+    array per block. A block is only valid until the next one is yielded.
+    """
+    num_rows, dim = matrix.shape
+    stage = np.empty((min(block_rows, num_rows), dim), dtype=np.float32)
+    for start in range(0, num_rows, block_rows):
+        block = stage[:min(block_rows, num_rows - start)]
+        np.copyto(block, matrix[start:start + len(block)], casting='same_kind')
+        yield start, block
+
+
+# Matrices at least this tall are scored on all cores; below it, thread
+# dispatch costs more than a single-core pass
+_PARALLEL_MIN_ROWS = 100_000
+_SCORE_THREADS = os.cpu_count() or 1
+_score_executor = None
+
+
+def _get_score_executor() -> ThreadPoolExecutor:
+    """Process-wide thread pool for sharded similarity scoring."""
+    global _score_executor
+    if _score_executor is None:
+        _score_executor = ThreadPoolExecutor(
+            max_workers=_SCORE_THREADS, thread_name_prefix="vector-score"
+        )
+    return _score_executor
+
+
+def _matvec_f16(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """float32 matrix @ vector for a float16 matrix, upcasting in blocks."""
+    scores = np.empty(len(matrix), dtype=np.float32)
+
+    def score_block(start):
+        block = matrix[start:start + _F16_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ vector
+
+    starts = range(0, len(matrix), _F16_BLOCK_ROWS)
+    if len(matrix) >= _PARALLEL_MIN_ROWS and _SCORE_THREADS > 1:
+        # The upcast and sgemv release the GIL, so blocks (disjoint slices
+        # of scores) are scored in parallel
+        list(_get_score_executor().map(score_block, starts))
+    else:
+        for start in starts:
+            score_block(start)
+    return scores
+
+
+def _as_query(query_embedding: np.ndarray, presume_normalized: bool = False) -> np.ndarray:
+    """
+    Query as a unit-norm, C-contiguous float32 vector.
+
+    SentenceTransformer can hand back float64 or strided vectors; matching
+    the index dtype keeps every kernel off slow upcasting paths. With
+    presume_normalized the norm check is skipped for callers that encode
+    with normalize_embeddings=True.
+    """
+    q = np.ascontiguousarray(query_embedding, dtype=np.float32)
+    if not presume_normalized:
+        norm = np.linalg.norm(q)
+        if norm and not np.isclose(norm, 1.0, atol=1e-4):
+            # Not in place: q may be the caller's (read-only) array
+            q = q / norm
+    return q
+
+
+def _cosine_scores(
+    query_embedding: np.ndarray,
+    embeddings_normed: np.ndarray,
+    emb_i8: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Cosine similarity of a unit-norm query (see _as_query) against a
+    normalized float16 matrix, scored on its int8 copy when one is given.
+
+    Returns:
+        float32 array of shape (len(embeddings_normed),)
+    """
+    q = np.ascontiguousarray(query_embedding, dtype=np.float32)
+    threads = _SCORE_THREADS if len(embeddings_normed) >= _PARALLEL_MIN_ROWS else 1
+    if emb_i8 is not None:
+        q_i8, _ = _quantize_int8(q[None, :])
+        distances = simsimd.cdist(q_i8, emb_i8, metric='cosine', threads=threads)
+        similarities = 1.0 - np.asarray(distances, dtype=np.float32)[0]
+    elif simsimd is not None:
+        # SIMD (AVX-512/AVX2/NEON) cosine kernel with native f16 loads;
+        # returns distances
+        distances = simsimd.cdist(
+            q[None, :].astype(np.float16), embeddings_normed, metric='cosine',
+            threads=threads
+        )
+        similarities = 1.0 - np.asarray(distances, dtype=np.float32)[0]
+    else:
+        similarities = _matvec_f16(embeddings_normed, q)
+    return similarities
+
+
+def _cosine_scores_batch(
+    query_embeddings: np.ndarray,
+    embeddings_normed: np.ndarray,
+    emb_i8: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    _cosine_scores for a (B, dim) batch of unit-norm queries, scoring the
+    whole batch in one pass over the matrix.
+
+    Returns:
+        float32 array of shape (B, len(embeddings_normed))
+    """
+    queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    threads = _SCORE_THREADS if len(embeddings_normed) >= _PARALLEL_MIN_ROWS else 1
+    if emb_i8 is not None:
+        queries_i8, _ = _quantize_int8(queries)
+        distances = simsimd.cdist(queries_i8, emb_i8, metric='cosine', threads=threads)
+        return 1.0 - np.asarray(distances, dtype=np.float32)
+    if simsimd is not None:
+        distances = simsimd.cdist(
+            queries.astype(np.float16), embeddings_normed, metric='cosine', threads=threads
+        )
+        return 1.0 - np.asarray(distances, dtype=np.float32)
+
+    # Blocked sgemm: each float16 block is upcast once for the whole batch
+    scores = np.empty((len(queries), len(embeddings_normed)), dtype=np.float32)
+    for start in range(0, len(embeddings_normed), _F16_BLOCK_ROWS):
+        block = embeddings_normed[start:start + _F16_BLOCK_ROWS].astype(np.float32)
+        scores[:, start:start + len(block)] = queries @ block.T
+    return scores
+
+
+def _filter_topk_impl(
+    sims: np.ndarray,
+    ratings: np.ndarray,
+    min_rating: float,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k similarities among rows with ratings >= min_rating, in one pass
+    keeping a size-k min-heap. Returns (indices, similarities), best first.
+    """
+    heap_sims = np.empty(max(k, 0), dtype=np.float32)
+    heap_idx = np.empty(max(k, 0), dtype=np.int64)
+    size = 0
+
+    for i in range(len(sims)):
+        if ratings[i] < min_rating:
+            continue
+        s = sims[i]
+        if size < k:
+            # Sift up
+            pos = size
+            size += 1
+            while pos > 0:
+                parent = (pos - 1) // 2
+                if heap_sims[parent] <= s:
+                    break
+                heap_sims[pos] = heap_sims[parent]
+                heap_idx[pos] = heap_idx[parent]
+                pos = parent
+            heap_sims[pos] = s
+            heap_idx[pos] = i
+        elif k > 0 and s > heap_sims[0]:
+            # Replace the root and sift down
+            pos = 0
+            while True:
+                child = 2 * pos + 1
+                if child >= size:
+                    break
+                if child + 1 < size and heap_sims[child + 1] < heap_sims[child]:
+                    child += 1
+                if heap_sims[child] >= s:
+                    break
+                heap_sims[pos] = heap_sims[child]
+                heap_idx[pos] = heap_idx[child]
+                pos = child
+            heap_sims[pos] = s
+            heap_idx[pos] = i
+
+    order = np.argsort(-heap_sims[:size])
+    return heap_idx[:size][order], heap_sims[:size][order]
+
+
+if numba is not None:
+    _filter_topk = numba.njit(cache=True)(_filter_topk_impl)
+else:
+    def _filter_topk(sims, ratings, min_rating, k):
+        """NumPy equivalent of _filter_topk_impl when numba is unavailable."""
+        candidates = np.flatnonzero(ratings >= min_rating)
+        if k <= 0 or not len(candidates):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if k < len(candidates):
+            candidates = candidates[np.argpartition(-sims[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-sims[candidates])]
+        return candidates, sims[candidates]
+
+
+def _match_codes_impl(
+    indices: np.ndarray,
+    codes: np.ndarray,
+    columns: np.ndarray,
+    wanted: np.ndarray
+) -> np.ndarray:
+    """
+    Mask of the rows in indices whose code in each of the given columns
+    of the (num_columns, num_rows) code matrix equals the wanted code.
+    """
+    mask = np.empty(len(indices), dtype=np.bool_)
+    for i in range(len(indices)):
+        row = indices[i]
+        match = True
+        for c in range(len(columns)):
+            if codes[columns[c], row] != wanted[c]:
+                match = False
+                break
+        mask[i] = match
+    return mask
+
+
+if numba is not None:
+    _match_codes = numba.njit(cache=True)(_match_codes_impl)
+else:
+    def _match_codes(indices, codes, columns, wanted):
+        """NumPy equivalent of _match_codes_impl when numba is unavailable."""
+        mask = np.ones(len(indices), dtype=bool)
+        for column, code in zip(columns, wanted):
+            mask &= codes[column][indices] == code
+        return mask
+
+
+def _top_indices(scores: np.ndarray, k: int, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first, optionally only among
+    candidates. argpartition keeps this O(N + k log k).
+    """
+    if candidates is None:
+        candidates = np.arange(len(scores))
+    k = min(k, len(candidates))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class _ColumnarMetadata:
+    """
+    Read-only list-of-dicts view over a pyarrow metadata table.
+
+    Rows are rebuilt as dicts only when indexed, for the few documents
+    returned; filters and numeric columns work on whole Arrow columns.
+    Arrow stores both a missing key and an explicit None as null, so the
+    keys each row lacked are kept in the MISSING_KEYS column and only
+    those are omitted from rebuilt dicts. Tables written before
+    FORMAT_VERSION have no such column and omit every null.
+    """
+
+    MISSING_KEYS = "__missing_keys__"
+    FORMAT_VERSION = b"2"
+
+    def __init__(self, table):
+        self.table = table
+        self._missing = None
+        if self.MISSING_KEYS in table.column_names:
+            self._missing = table.column(self.MISSING_KEYS)
+        self._legacy = (table.schema.metadata or {}).get(b"metadata_format") != self.FORMAT_VERSION
+        self._columns = {
+            name: table.column(name) for name in table.column_names if name != self.MISSING_KEYS
+        }
+        # Built on the first filter: see _code_matrix
+        self._codes = None
+        self._code_lookup = None
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, idx) -> Dict[str, Any]:
+        idx = int(idx)
+        missing = ()
+        if self._missing is not None:
+            missing = self._missing[idx].as_py() or ()
+        row = {}
+        for name, column in self._columns.items():
+            if name in missing:
+                continue
+            value = column[idx].as_py()
+            if value is not None or not self._legacy:
+                row[name] = value
+        return row
+
+    @classmethod
+    def from_dicts(cls, metadatas: List[Dict[str, Any]]):
+        """Build from per-document dicts; missing keys become nulls."""
+        keys = dict.fromkeys(key for m in metadatas for key in m)
+        columns = {key: pa.array([m.get(key) for m in metadatas]) for key in keys}
+        missing = [[key for key in keys if key not in m] or None for m in metadatas]
+        if any(missing):
+            columns[cls.MISSING_KEYS] = pa.array(missing, type=pa.list_(pa.string()))
+        table = pa.table(columns).replace_schema_metadata({b"metadata_format": cls.FORMAT_VERSION})
+        return cls(table)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def float_column(self, name: str, fill: float = 0) -> np.ndarray:
+        """Column as float32, with nulls (and a missing column) as fill."""
+        if name not in self._columns:
+            return np.full(len(self), fill, dtype=np.float32)
+        column = pc.cast(self._columns[name], pa.float32()).fill_null(fill)
+        return column.to_numpy()
+
+    def equal_mask(self, key: str, value: Any, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boolean mask of rows (all, or only indices) whose key equals value."""
+        num_rows = len(self) if indices is None else len(indices)
+        if key not in self._columns:
+            return np.full(num_rows, value is None)
+        column = self._columns[key]
+        if indices is not None:
+            column = column.take(pa.array(np.asarray(indices, dtype=np.int64)))
+        if value is None:
+            return pc.is_null(column).to_numpy(zero_copy_only=False)
+        if pa.types.is_nested(column.type) or isinstance(value, (list, tuple, dict)):
+            # No Arrow scalar comparison for lists or structs: compare the
+            # Python values row by row, as the per-document dicts did
+            return np.fromiter((v == value for v in column.to_pylist()), dtype=bool, count=num_rows)
+        try:
+            mask = pc.equal(column, pa.scalar(value))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            # Type mismatch, e.g. a string column against an int
+            return np.zeros(num_rows, dtype=bool)
+        return mask.fill_null(False).to_numpy(zero_copy_only=False)
+
+    def _code_matrix(self) -> Tuple[np.ndarray, Dict[str, Tuple[int, Dict[Any, int]]]]:
+        """
+        Dictionary-encode every column once, as rows of an int32 (columns,
+        documents) matrix with nulls as -1, and a per-column map from
+        value to code. Columns Arrow cannot encode (e.g. lists) are left
+        out and filtered with equal_mask instead.
+        """
+        if self._codes is None:
+            rows, lookup = [], {}
+            for name, column in self._columns.items():
+                if pa.types.is_nested(column.type):
+                    continue
+                try:
+                    encoded = column.combine_chunks().dictionary_encode()
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                    continue
+                values = {value: code for code, value in enumerate(encoded.dictionary.to_pylist())}
+                lookup[name] = (len(rows), values)
+                rows.append(
+                    pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False).astype(np.int32)
+                )
+            codes = np.vstack(rows) if rows else np.empty((0, len(self)), dtype=np.int32)
+            self._code_lookup = lookup
+            self._codes = np.ascontiguousarray(codes)
+        return self._codes, self._code_lookup
+
+    def match_mask(self, filter_dict: Dict, indices: np.ndarray) -> np.ndarray:
+        """
+        Boolean mask of the rows in indices whose metadata matches every
+        filter. Compares integer codes, so the cost is per candidate, not
+        per document.
+        """
+        codes, lookup = self._code_matrix()
+        no_match = np.zeros(len(indices), dtype=bool)
+        columns, wanted, unencoded = [], [], []
+        for key, value in filter_dict.items():
+            if key not in self._columns:
+                if value is None:
+                    continue
+                return no_match
+            if key not in lookup:
+                unencoded.append((key, value))
+                continue
+            row, values = lookup[key]
+            try:
+                code = -1 if value is None else values.get(value)
+            except TypeError:
+                # Unhashable filter value; no stored scalar equals it
+                code = None
+            if code is None:
+                return no_match
+            columns.append(row)
+            wanted.append(code)
+
+        mask = _match_codes(
+            indices, codes, np.array(columns, dtype=np.int64), np.array(wanted, dtype=np.int32)
+        )
+        for key, value in unencoded:
+            mask &= self.equal_mask(key, value, indices)
+        return mask
+
+
+class _MappedTexts:
+    """
+    Read-only list view over document texts stored as one memory-mapped
+    UTF-8 blob plus an offsets array. Opening it reads no text; a text is
+    decoded only when indexed, for the few documents returned.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx) -> str:
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
 
 class SimpleVectorStore:
     """Simple vector store wrapper for LangChain."""
 
-    def __init__(self, index_dir: str):
+    # HNSW build/search parameters
+    HNSW_M = 16
+    HNSW_EF_CONSTRUCTION = 64
+    HNSW_EF_SEARCH = 64
+
+    # Scalar quantizer for the HNSW graph's stored vectors when it is a
+    # FAISS IndexHNSWSQ: "fp16" halves them versus hnswlib's float32
+    # copy, "int8" (trained per-dimension ranges) quarters them. None
+    # keeps hnswlib's full float32 vectors
+    HNSW_SCALAR_QUANTIZER = "fp16"
+    _SQ_TYPES = {"fp16": "QT_fp16", "int8": "QT_8bit"}
+
+    # Extra candidates fetched per result when a metadata filter is applied
+    FILTER_OVERFETCH = 4
+
+    # Filters matching at most this many documents are scored exactly over
+    # the matching rows instead of through the index: a restricted HNSW or
+    # IVF walk finds k hits on a selective filter but misses many of the
+    # true top k, and gathering a few thousand rows is cheap
+    FILTER_EXACT_MAX_DOCS = 10_000
+
+    # Stores smaller than this are scanned exactly: one matvec over a few
+    # thousand rows is cheaper than an HNSW walk, and exact
+    ANN_MIN_DOCS = 10_000
+
+    # Stores at least this large search a GPU-resident FAISS flat index
+    GPU_MIN_DOCS = 100_000
+
+    # Without a GPU, stores at least this large use a FAISS IVF-PQ index
+    # instead of HNSW: PQ codes are a few dozen bytes per vector, so the
+    # index stays small and the full matrix is only read for rescoring
+    IVFPQ_MIN_DOCS = 100_000
+    IVFPQ_NPROBE = 16
+    IVFPQ_RERANK = 4  # PQ candidates per result, rescored exactly
+
+    # Saved FAISS indexes at least this large are memory-mapped read-only
+    # rather than read into RAM; the OS page cache holds the working set
+    FAISS_MMAP_MIN_BYTES = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        index_dir: str,
+        use_ann: bool = True,
+        quantize: bool = True,
+        use_gpu: bool = True
+    ):
         """
         Load a simple numpy-based vector index.
 
         Args:
             index_dir: Directory containing the vector index
+            use_ann: For stores of at least ANN_MIN_DOCS documents, search
+                an HNSW graph instead of scanning every embedding: a FAISS
+                IndexHNSWSQ with HNSW_SCALAR_QUANTIZER vectors if faiss is
+                installed, else hnswlib. The graph is built on first load
+                and saved next to the embeddings (index_hnsw_<sq>.faiss or
+                index.bin). Stores of at least IVFPQ_MIN_DOCS documents use
+                a FAISS IVF-PQ index (index_ivfpq.faiss) instead when faiss
+                is installed. Smaller stores, or stores without either
+                library, use exact search
+            quantize: Keep an int8 copy of the embeddings (per-row scale)
+                for exact search, scored with SimSIMD's int8 cosine kernel.
+                Quantized once and saved as embeddings_i8.npy, then
+                memory-mapped.
+                Reads a quarter of the bytes per query; scales cancel under
+                cosine, so rankings match float search closely
+            use_gpu: For stores of at least GPU_MIN_DOCS documents, keep
+                the embeddings in a FAISS IndexFlatIP on the first GPU
+                (needs faiss-gpu) and search there: exact results at
+                GPU memory bandwidth. Replaces the HNSW graph when used
         """
         index_path = Path(index_dir)
 
-        self.embeddings = np.load(index_path / "embeddings.npy")
+        # Normalized float16 matrix, memory-mapped read-only
+        self.embeddings_normed = self._load_normalized_embeddings(index_path)
+
+        # The int8 kernels are SimSIMD's; NumPy has no fast int8 matvec
+        self.emb_i8 = None
+        self.emb_scale = None
+        if quantize and simsimd is not None:
+            self.emb_i8, self.emb_scale = self._load_int8_embeddings(
+                index_path, self.embeddings_normed
+            )
+
+        self.texts = self._load_texts(index_path)
 
-        with open(index_path / "texts.pkl", 'rb') as f:
-            self.texts = pickle.load(f)
+        self.metadatas = self._load_metadata(index_path)
 
-        with open(index_path / "metadata.pkl", 'rb') as f:
-            self.metadatas = pickle.load(f)
+        # Numeric metadata as a column, for filtering without dict lookups
+        if isinstance(self.metadatas, _ColumnarMetadata):
+            self.meta_rating = self.metadatas.float_column('rating')
+        else:
+            self.meta_rating = np.array(
+                [m.get('rating') or 0 for m in self.metadatas], dtype=np.float32
+            )
 
         print(f"✅ Loaded vector store from {index_dir}")
         print(f"   Documents: {len(self.texts)}")
-        print(f"   Embedding dim: {self.embeddings.shape[1]}")
+        print(f"   Embedding dim: {self.embeddings_normed.shape[1]}")
+
+        self.gpu_index = None
+        if (use_gpu and len(self.texts) >= self.GPU_MIN_DOCS and faiss is not None
+                and hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0):
+            self.gpu_index = self._build_gpu_index()
+
+        self.ivfpq_index = None
+        if (use_ann and self.gpu_index is None and faiss is not None
+                and len(self.texts) >= self.IVFPQ_MIN_DOCS):
+            self.ivfpq_index = self._load_or_build_ivfpq_index(index_path / "index_ivfpq.faiss")
+
+        self.ann_index = None
+        self._faiss_ann = False
+        if (use_ann and self.gpu_index is None and self.ivfpq_index is None
+                and len(self.texts) >= self.ANN_MIN_DOCS):
+            if faiss is not None and self.HNSW_SCALAR_QUANTIZER:
+                self.ann_index = self._load_or_build_sq_hnsw_index(
+                    index_path / f"index_hnsw_{self.HNSW_SCALAR_QUANTIZER}.faiss"
+                )
+                self._faiss_ann = True
+            elif hnswlib is not None:
+                self.ann_index = self._load_or_build_ann_index(index_path / "index.bin")
+
+    @property
+    def indexed(self) -> bool:
+        """Whether top-k comes from an index (HNSW, IVF-PQ or GPU), not a CPU scan."""
+        return (
+            self.ann_index is not None
+            or self.ivfpq_index is not None
+            or self.gpu_index is not None
+        )
+
+    @staticmethod
+    def _load_normalized_embeddings(index_path: Path) -> np.ndarray:
+        """
+        Memory-map the L2-normalized float16 embeddings, converting
+        embeddings.npy to embeddings_f16.npy on first load (or whenever
+        embeddings.npy is newer). float16 halves the bytes read per query
+        at negligible cost to cosine ranking.
+
+        embeddings.npy is expected to hold float32 rows, as the build
+        scripts write; other dtypes are converted block by block.
+        """
+        source = index_path / "embeddings.npy"
+        converted = index_path / "embeddings_f16.npy"
+
+        if not converted.exists() or converted.stat().st_mtime < source.stat().st_mtime:
+            # Normalize once here so each query is a single matvec, one
+            # cache-sized row block at a time: the source is memory-mapped
+            # and no full float32 copy is ever held
+            embeddings = np.load(source, mmap_mode='r')
+            num_docs, dim = embeddings.shape
+
+            # The build scripts write unit-norm float32 rows; when the
+            # first row shows that contract holds (norm within 1e-4 of 1),
+            # blocks are only converted, not renormalized
+            presume_normalized = (
+                embeddings.dtype == np.float32 and num_docs > 0
+                and abs(float(np.linalg.norm(embeddings[0])) - 1.0) < 1e-4
+            )
+
+            # Written under a temporary name and renamed once complete, so
+            # an interrupted conversion is not mistaken for a finished one
+            partial = converted.with_name(converted.name + ".tmp")
+            try:
+                # C-contiguous whatever the source's layout, so row blocks
+                # are contiguous for BLAS and SimSIMD
+                normed = np.lib.format.open_memmap(
+                    partial, mode='w+', dtype=np.float16, shape=(num_docs, dim)
+                )
+            except OSError as e:
+                print(f"⚠️  Could not save {converted}: {e}")
+                normed = np.empty((num_docs, dim), dtype=np.float16)
+
+            # Rows per block so one float32 block fits a 256 KB L2 slice
+            block_rows = max(64, 256 * 1024 // (4 * dim))
+            if presume_normalized:
+                # Cast straight into the output, no float32 staging pass
+                for start in range(0, num_docs, block_rows):
+                    normed[start:start + block_rows] = embeddings[start:start + block_rows]
+            else:
+                for start, block in _iter_f32_blocks(embeddings, block_rows):
+                    if faiss is not None:
+                        # In-place SIMD pass; zero rows are left as zeros
+                        faiss.normalize_L2(block)
+                    else:
+                        norms = np.linalg.norm(block, axis=1, keepdims=True)
+                        norms[norms == 0] = 1
+                        block /= norms
+                    normed[start:start + len(block)] = block
+            del embeddings
+
+            if not isinstance(normed, np.memmap):
+                return normed
+            normed.flush()
+            del normed
+            os.replace(partial, converted)
+
+        return np.load(converted, mmap_mode='r')
+
+    @staticmethod
+    def _load_int8_embeddings(
+        index_path: Path,
+        embeddings_normed: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-map the int8 copy of the normalized embeddings and its
+        per-row scales, quantizing embeddings_f16.npy block by block into
+        embeddings_i8.npy and embeddings_i8_scale.npy on first use (or
+        whenever the float16 matrix is newer).
+        """
+        source = index_path / "embeddings_f16.npy"
+        codes_path = index_path / "embeddings_i8.npy"
+        scale_path = index_path / "embeddings_i8_scale.npy"
+
+        # The scales are written last, so they date the conversion
+        if (scale_path.exists() and source.exists()
+                and scale_path.stat().st_mtime >= source.stat().st_mtime):
+            codes = np.load(codes_path, mmap_mode='r')
+            if codes.shape == embeddings_normed.shape:
+                return codes, np.load(scale_path)
+            del codes
+
+        num_docs, dim = embeddings_normed.shape
+        partial = codes_path.with_name(codes_path.name + ".tmp")
+        try:
+            codes = np.lib.format.open_memmap(partial, mode='w+', dtype=np.int8, shape=(num_docs, dim))
+        except OSError as e:
+            print(f"⚠️  Could not save {codes_path}: {e}")
+            codes = np.empty((num_docs, dim), dtype=np.int8)
+        scale = np.empty(num_docs, dtype=np.float32)
+        for start, block in _iter_f32_blocks(embeddings_normed, _F16_BLOCK_ROWS):
+            codes[start:start + len(block)], scale[start:start + len(block)] = _quantize_int8(block)
+
+        if not isinstance(codes, np.memmap):
+            return codes, scale
+        codes.flush()
+        del codes
+        os.replace(partial, codes_path)
+        try:
+            np.save(scale_path, scale)
+        except OSError as e:
+            print(f"⚠️  Could not save {scale_path}: {e}")
+        return np.load(codes_path, mmap_mode='r'), scale
+
+    @staticmethod
+    def _load_texts(index_path: Path) -> _MappedTexts:
+        """
+        Memory-map the document texts, converting texts.pkl to texts.bin
+        (concatenated UTF-8) and texts_offsets.npy (n + 1 byte offsets) on
+        first load, or whenever the pickle is newer.
+        """
+        source = index_path / "texts.pkl"
+        blob_path = index_path / "texts.bin"
+        offsets_path = index_path / "texts_offsets.npy"
+
+        # The offsets are written last, so they date the conversion
+        if not offsets_path.exists() or (
+            source.exists() and offsets_path.stat().st_mtime < source.stat().st_mtime
+        ):
+            with open(source, 'rb') as f:
+                encoded = [text.encode("utf-8") for text in pickle.load(f)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(text) for text in encoded], out=offsets[1:])
+            blob = b"".join(encoded)
+            del encoded
+            try:
+                with open(blob_path, 'wb') as f:
+                    f.write(blob)
+                np.save(offsets_path, offsets)
+            except OSError as e:
+                print(f"⚠️  Could not save {blob_path}: {e}")
+                return _MappedTexts(np.frombuffer(blob, dtype=np.uint8), offsets)
+
+        offsets = np.load(offsets_path, mmap_mode='r')
+        # np.memmap cannot map an empty file
+        if offsets[-1] == 0:
+            return _MappedTexts(np.empty(0, dtype=np.uint8), offsets)
+        return _MappedTexts(np.memmap(blob_path, dtype=np.uint8, mode='r'), offsets)
+
+    @staticmethod
+    def _load_metadata(index_path: Path):
+        """
+        Load document metadata as a columnar pyarrow table, converting
+        metadata.pkl to metadata.parquet on first load (or whenever the
+        pickle is newer). Falls back to the pickled list of dicts when
+        pyarrow is not installed or the metadata does not fit a table.
+        """
+        source = index_path / "metadata.pkl"
+        converted = index_path / "metadata.parquet"
+
+        if pa is not None:
+            if converted.exists() and (
+                not source.exists() or converted.stat().st_mtime >= source.stat().st_mtime
+            ):
+                # Column chunks are decoded straight from the mapped file,
+                # without first reading it into a buffer
+                metadata = _ColumnarMetadata(pq.read_table(converted, memory_map=True))
+                # Reconvert tables that could not tell None from missing
+                if not metadata._legacy or not source.exists():
+                    return metadata
+
+        with open(source, 'rb') as f:
+            metadatas = pickle.load(f)
+        if pa is None:
+            return metadatas
+
+        try:
+            metadata = _ColumnarMetadata.from_dicts(metadatas)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            print(f"⚠️  Keeping pickled metadata, not representable as a table: {e}")
+            return metadatas
+
+        try:
+            pq.write_table(metadata.table, converted)
+        except OSError as e:
+            print(f"⚠️  Could not save {converted}: {e}")
+        return metadata
+
+    def _filter_mask(self, filter_dict: Dict, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Boolean mask of documents whose metadata matches every filter:
+        over all documents, or only over indices (e.g. ANN candidates).
+        """
+        if indices is None:
+            indices = np.arange(len(self.metadatas))
+        indices = np.asarray(indices, dtype=np.int64)
+
+        if isinstance(self.metadatas, _ColumnarMetadata):
+            return self.metadatas.match_mask(filter_dict, indices)
+
+        return np.fromiter(
+            (
+                all(self.metadatas[i].get(key) == value for key, value in filter_dict.items())
+                for i in indices
+            ),
+            dtype=bool,
+            count=len(indices)
+        )
+
+    def _build_gpu_index(self):
+        """Copy the embeddings into a float16 FAISS flat index on GPU 0."""
+        num_docs, dim = self.embeddings_normed.shape
+        # The resources object owns the GPU memory; keep it alive with the index
+        self._gpu_resources = faiss.StandardGpuResources()
+        options = faiss.GpuClonerOptions()
+        options.useFloat16 = True
+        index = faiss.index_cpu_to_gpu(
+            self._gpu_resources, 0, faiss.IndexFlatIP(dim), options
+        )
+
+        # Upload in blocks so the float32 staging copy stays small
+        for _, block in _iter_f32_blocks(self.embeddings_normed, _F16_BLOCK_ROWS * 16):
+            index.add(block)
+        print(f"   Built GPU flat index ({num_docs} vectors)")
+        return index
+
+    def _read_faiss_index(self, path: Path, mmap_flag: int):
+        """Read a saved FAISS index, memory-mapped with mmap_flag if the file is large."""
+        if mmap_flag and path.stat().st_size >= self.FAISS_MMAP_MIN_BYTES:
+            return faiss.read_index(str(path), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        return faiss.read_index(str(path))
+
+    def _load_or_build_ivfpq_index(self, path: Path):
+        """
+        Load the saved IVF-PQ index, rebuilding it if missing or stale.
+        Returns None (use HNSW instead) if no PQ split fits the dimension.
+        """
+        num_docs, dim = self.embeddings_normed.shape
+
+        if path.exists():
+            # Inverted lists are mapped straight from the file
+            index = self._read_faiss_index(path, faiss.IO_FLAG_MMAP)
+            if index.ntotal == num_docs:
+                index.nprobe = self.IVFPQ_NPROBE
+                return index
+            # Unmap before the rebuilt index overwrites the file
+            del index
+
+        # Largest of the FAISS-optimized sub-quantizer counts that divides dim
+        m_pq = next((m for m in (32, 16, 8) if dim % m == 0), None)
+        if m_pq is None:
+            return None
+
+        nlist = max(1, int(4 * np.sqrt(num_docs)))
+        index = faiss.IndexIVFPQ(
+            faiss.IndexFlatIP(dim), dim, nlist, m_pq, 8, faiss.METRIC_INNER_PRODUCT
+        )
+
+        # Train on a sorted random sample (sequential memmap reads); FAISS
+        # wants a few dozen points per coarse and per PQ centroid
+        num_train = min(num_docs, max(64 * nlist, 256 * 64))
+        sample = np.sort(np.random.default_rng(0).choice(num_docs, num_train, replace=False))
+        index.train(np.ascontiguousarray(self.embeddings_normed[sample], dtype=np.float32))
+
+        for _, block in _iter_f32_blocks(self.embeddings_normed, _F16_BLOCK_ROWS * 16):
+            index.add(block)
+        index.nprobe = self.IVFPQ_NPROBE
+
+        try:
+            faiss.write_index(index, str(path))
+        except RuntimeError as e:
+            print(f"⚠️  Could not save IVF-PQ index to {path}: {e}")
+        print(f"   Built IVF-PQ index ({num_docs} vectors, nlist={nlist}, m={m_pq})")
+        return index
+
+    def _load_or_build_sq_hnsw_index(self, path: Path):
+        """Load the saved scalar-quantized FAISS HNSW graph, rebuilding it if missing or stale."""
+        num_docs, dim = self.embeddings_normed.shape
+
+        if path.exists():
+            # The quantized vectors (flat codes) are mapped from the file;
+            # older FAISS without IO_FLAG_MMAP_IFC reads them into RAM
+            index = self._read_faiss_index(path, getattr(faiss, 'IO_FLAG_MMAP_IFC', 0))
+            if index.ntotal == num_docs:
+                return index
+            del index
+
+        quantizer_type = getattr(faiss.ScalarQuantizer, self._SQ_TYPES[self.HNSW_SCALAR_QUANTIZER])
+        index = faiss.IndexHNSWSQ(dim, quantizer_type, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+
+        if not index.is_trained:
+            # fp16 needs no training; int8 learns per-dimension ranges
+            num_train = min(num_docs, 65_536)
+            sample = np.sort(np.random.default_rng(0).choice(num_docs, num_train, replace=False))
+            index.train(np.ascontiguousarray(self.embeddings_normed[sample], dtype=np.float32))
+        for _, block in _iter_f32_blocks(self.embeddings_normed, _F16_BLOCK_ROWS * 16):
+            index.add(block)
+
+        try:
+            faiss.write_index(index, str(path))
+        except RuntimeError as e:
+            print(f"⚠️  Could not save HNSW index to {path}: {e}")
+        print(f"   Built HNSW-SQ {self.HNSW_SCALAR_QUANTIZER} index ({num_docs} vectors)")
+        return index
+
+    def _load_or_build_ann_index(self, path: Path):
+        """Load the saved HNSW graph, rebuilding it if missing or stale."""
+        num_docs, dim = self.embeddings_normed.shape
+        index = hnswlib.Index(space='cosine', dim=dim)
+
+        if path.exists():
+            index.load_index(str(path), max_elements=num_docs)
+            if index.get_current_count() == num_docs:
+                index.set_ef(max(self.HNSW_EF_SEARCH, 1))
+                return index
+            index = hnswlib.Index(space='cosine', dim=dim)
+
+        index.init_index(
+            max_elements=num_docs,
+            ef_construction=self.HNSW_EF_CONSTRUCTION,
+            M=self.HNSW_M
+        )
+        # In blocks: hnswlib would otherwise upcast the whole float16
+        # matrix to one float32 copy
+        for start, block in _iter_f32_blocks(self.embeddings_normed, _F16_BLOCK_ROWS * 16):
+            index.add_items(block, np.arange(start, start + len(block)))
+        index.set_ef(self.HNSW_EF_SEARCH)
+        try:
+            index.save_index(str(path))
+        except OSError as e:
+            print(f"⚠️  Could not save HNSW index to {path}: {e}")
+        print(f"   Built HNSW index ({num_docs} vectors)")
+        return index
 
     def similarity_search(
         self,
         query_embedding: np.ndarray,
         k: int = 5,
-        filter_dict: Optional[Dict] = None
+        filter_dict: Optional[Dict] = None,
+        presume_normalized: bool = False
     ) -> List[Document]:
         """
         Search for similar documents.
@@ -53,43 +977,362 @@ class SimpleVectorStore:
             query_embedding: Query embedding vector
             k: Number of results
             filter_dict: Optional metadata filters
+            presume_normalized: The query is already unit-norm; skip the
+                norm check
 
         Returns:
             List of LangChain Document objects
         """
-        # Compute cosine similarities
-        query_norm = query_embedding / np.linalg.norm(query_embedding)
-        doc_norms = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
-        similarities = np.dot(doc_norms, query_norm)
-
-        # Get top-k indices
-        top_indices = np.argsort(similarities)[::-1]
+        query_embedding = _as_query(query_embedding, presume_normalized)
 
-        # Apply filters if provided
-        results = []
-        for idx in top_indices:
-            metadata = self.metadatas[idx]
+        if self.indexed:
+            results = self._ann_search(query_embedding, k, filter_dict)
+            # A selective filter can reject every index candidate; rescan
+            # exactly rather than return too few results
+            if len(results) >= k or not filter_dict:
+                return results
 
-            # Check filters
-            if filter_dict:
-                match = all(metadata.get(k) == v for k, v in filter_dict.items())
-                if not match:
-                    continue
+        return self._exact_search(query_embedding, k, filter_dict)
 
-            # Create LangChain Document
-            doc = Document(
+    def _exact_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        filter_dict: Optional[Dict]
+    ) -> List[Document]:
+        """Exhaustive cosine search over every embedding."""
+        similarities = self.similarities(query_embedding, presume_normalized=True)
+
+        # Apply filters if provided, as one mask over the metadata columns,
+        # so only matching documents are ranked
+        candidates = None
+        if filter_dict:
+            candidates = np.flatnonzero(self._filter_mask(filter_dict))
+        top_indices = _top_indices(similarities, k, candidates)
+
+        return self._documents(top_indices, similarities[top_indices])
+
+    def _documents(self, indices: np.ndarray, similarities: np.ndarray) -> List[Document]:
+        """LangChain Documents for the final results only, after filtering."""
+        return [
+            Document(
                 page_content=self.texts[idx],
                 metadata={
-                    **metadata,
-                    'similarity': float(similarities[idx])
+                    **self.metadatas[idx],
+                    'similarity': float(similarity)
                 }
             )
-            results.append(doc)
+            for idx, similarity in zip(indices, similarities)
+        ]
 
-            if len(results) >= k:
-                break
+    def top_k_by_rating(
+        self,
+        query_embedding: np.ndarray,
+        min_rating: float,
+        k: int,
+        presume_normalized: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Most similar documents whose rating is at least min_rating.
 
-        return results
+        Args:
+            query_embedding: Query embedding vector
+            min_rating: Minimum 'rating' metadata value
+            k: Number of results
+            presume_normalized: The query is already unit-norm; skip the
+                norm check
+
+        Returns:
+            Tuple of (document indices, similarities), most similar first
+        """
+        query_embedding = _as_query(query_embedding, presume_normalized)
+
+        # Threshold in the column's dtype so 4.1 keeps matching a stored 4.1
+        threshold = self.meta_rating.dtype.type(min_rating)
+
+        if self.indexed:
+            # Filter the index candidates with one mask over the rating column
+            indices, similarities = self.similarity_search_indices(
+                query_embedding, k * self.FILTER_OVERFETCH, presume_normalized=True
+            )
+            keep = self.meta_rating[indices] >= threshold
+            if keep.sum() >= k or len(indices) == len(self.texts):
+                return indices[keep][:k], similarities[keep][:k]
+
+        return _filter_topk(
+            self.similarities(query_embedding, presume_normalized=True),
+            self.meta_rating, threshold, k
+        )
+
+    def similarity_search_indices(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        presume_normalized: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k search like similarity_search, returned as arrays without
+        building Document objects.
+
+        Args:
+            query_embedding: Query embedding vector
+            k: Number of results
+            presume_normalized: The query is already unit-norm; skip the
+                norm check
+
+        Returns:
+            Tuple of (document indices, similarities), most similar first
+        """
+        query_embedding = _as_query(query_embedding, presume_normalized)
+        k = min(k, len(self.texts))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.indexed:
+            return self._ann_candidates(query_embedding, k)
+
+        similarities = self.similarities(query_embedding, presume_normalized=True)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return top, similarities[top]
+
+    def similarity_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        presume_normalized: bool = False
+    ) -> List[List[Document]]:
+        """
+        Unfiltered top-k search for a batch of queries in one index call:
+        one GPU/FAISS/hnswlib search over the (B, dim) batch, or one pass
+        over the embedding matrix for exact search.
+
+        Args:
+            query_embeddings: Array of shape (B, dim)
+            k: Number of results per query
+            presume_normalized: The queries are already unit-norm; skip
+                the norm check
+
+        Returns:
+            One list of LangChain Documents per query, most similar first
+        """
+        queries = np.ascontiguousarray(np.atleast_2d(query_embeddings), dtype=np.float32)
+        if not presume_normalized:
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            # As in _as_query: no copy when every query is already unit-norm
+            if not np.allclose(norms, 1.0, atol=1e-4):
+                norms[norms == 0] = 1
+                queries = queries / norms
+
+        k = min(k, len(self.texts))
+        if k <= 0 or not len(queries):
+            return [[] for _ in queries]
+
+        if self.indexed:
+            labels, similarities = self._ann_candidates_batch(queries, k)
+            return [
+                self._documents(row_labels[row_labels >= 0], row_sims[row_labels >= 0])
+                for row_labels, row_sims in zip(labels, similarities)
+            ]
+
+        scores = _cosine_scores_batch(queries, self.embeddings_normed, self.emb_i8)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [self._documents(row, row_scores) for row, row_scores in zip(top, top_scores)]
+
+    def _ann_candidates_batch(self, queries: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        _ann_candidates for a (B, dim) batch in one index call, as (B, n)
+        labels and similarities. Missing results are labelled -1.
+        """
+        if self.gpu_index is not None:
+            similarities, labels = self.gpu_index.search(queries, n)
+            return labels.astype(np.int64), similarities.astype(np.float32)
+
+        if self.ivfpq_index is not None:
+            # One search for the whole batch, then each query's candidates
+            # are rescored exactly as in _ann_candidates
+            _, candidates = self.ivfpq_index.search(
+                queries, min(n * self.IVFPQ_RERANK, len(self.texts))
+            )
+            labels = np.full((len(queries), n), -1, dtype=np.int64)
+            similarities = np.zeros((len(queries), n), dtype=np.float32)
+            for row, (query, row_candidates) in enumerate(zip(queries, candidates)):
+                row_candidates = row_candidates[row_candidates >= 0]
+                row_similarities = (
+                    np.asarray(self.embeddings_normed[row_candidates], dtype=np.float32) @ query
+                )
+                top = _top_indices(row_similarities, n)
+                labels[row, :len(top)] = row_candidates[top]
+                similarities[row, :len(top)] = row_similarities[top]
+            return labels, similarities
+
+        if self._faiss_ann:
+            params = faiss.SearchParametersHNSW(efSearch=max(self.HNSW_EF_SEARCH, n))
+            similarities, labels = self.ann_index.search(queries, n, params=params)
+            return labels.astype(np.int64), similarities.astype(np.float32)
+
+        self.ann_index.set_ef(max(self.HNSW_EF_SEARCH, n))
+        labels, distances = self.ann_index.knn_query(queries, k=n)
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+
+    def similarities(
+        self,
+        query_embedding: np.ndarray,
+        presume_normalized: bool = False
+    ) -> np.ndarray:
+        """
+        Cosine similarity of the query against every stored embedding.
+
+        Args:
+            query_embedding: Query embedding vector
+            presume_normalized: The query is already unit-norm; skip the
+                norm check
+
+        Returns:
+            float32 array of shape (num_documents,)
+        """
+        return _cosine_scores(
+            _as_query(query_embedding, presume_normalized), self.embeddings_normed, self.emb_i8
+        )
+
+    def _ann_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        filter_dict: Optional[Dict]
+    ) -> List[Document]:
+        """Top-k via the HNSW graph, IVF-PQ or GPU index, filtering the candidates."""
+        if filter_dict and self._supports_id_selector:
+            allowed = np.flatnonzero(self._filter_mask(filter_dict))
+            if len(allowed) <= self.FILTER_EXACT_MAX_DOCS:
+                # Selective filter: score the matching rows exactly
+                similarities = (
+                    np.asarray(self.embeddings_normed[allowed], dtype=np.float32) @ query_embedding
+                )
+                top = _top_indices(similarities, k)
+                return self._documents(allowed[top], similarities[top])
+
+            # Broad filter: the FAISS index skips non-matching ids during
+            # the search itself, so no over-fetch is needed to end up with
+            # k results
+            labels, similarities = self._ann_candidates(query_embedding, k, allowed)
+            return self._documents(labels, similarities)
+
+        num_candidates = k * self.FILTER_OVERFETCH if filter_dict else k
+        num_candidates = min(num_candidates, len(self.texts))
+        if num_candidates <= 0:
+            return []
+
+        labels, similarities = self._ann_candidates(query_embedding, num_candidates)
+        if filter_dict:
+            keep = self._filter_mask(filter_dict, labels)
+            labels, similarities = labels[keep], similarities[keep]
+
+        return self._documents(labels[:k], similarities[:k])
+
+    @property
+    def _supports_id_selector(self) -> bool:
+        """Whether the ANN index can restrict its search to a set of ids."""
+        return self.gpu_index is None and (self.ivfpq_index is not None or self._faiss_ann)
+
+    def _ann_candidates(
+        self,
+        query_embedding: np.ndarray,
+        n: int,
+        allowed: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index nearest neighbours as (indices, similarities), best first.
+
+        Args:
+            query_embedding: Unit-norm query vector
+            n: Number of neighbours
+            allowed: Optional int64 document ids the search is restricted
+                to; only supported when _supports_id_selector is true
+        """
+        # Kept referenced until the search returns; FAISS does not own it
+        selector = None
+        if allowed is not None:
+            allowed = np.ascontiguousarray(allowed, dtype=np.int64)
+            selector = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(allowed))
+
+        if self.gpu_index is not None:
+            # Inner product of unit vectors is the cosine similarity
+            similarities, labels = self.gpu_index.search(query_embedding[None, :], n)
+            return labels[0].astype(np.int64), similarities[0].astype(np.float32)
+
+        if self.ivfpq_index is not None:
+            # PQ scores are approximate: over-fetch, then rescore the
+            # candidates exactly against their stored embeddings
+            num_fetch = min(n * self.IVFPQ_RERANK, len(self.texts if allowed is None else allowed))
+            params = None
+            if selector is not None:
+                params = faiss.SearchParametersIVF(nprobe=self.IVFPQ_NPROBE, sel=selector)
+            _, labels = self.ivfpq_index.search(query_embedding[None, :], num_fetch, params=params)
+            labels = labels[0][labels[0] >= 0]
+            similarities = np.asarray(self.embeddings_normed[labels], dtype=np.float32) @ query_embedding
+            top = _top_indices(similarities, n)
+            return labels[top].astype(np.int64), similarities[top]
+
+        if self._faiss_ann:
+            # Per-call parameters, so concurrent searches do not race on efSearch
+            params = faiss.SearchParametersHNSW(efSearch=max(self.HNSW_EF_SEARCH, n), sel=selector)
+            similarities, labels = self.ann_index.search(query_embedding[None, :], n, params=params)
+            keep = labels[0] >= 0
+            return labels[0][keep].astype(np.int64), similarities[0][keep].astype(np.float32)
+
+        # knn_query needs ef >= the number of neighbours requested
+        self.ann_index.set_ef(max(self.HNSW_EF_SEARCH, n))
+        labels, distances = self.ann_index.knn_query(query_embedding, k=n)
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=2)
+def _get_embedder(model_name: str, onnx: bool = False):
+    """
+    Load a query embedding model once per process. Every PathWayRAG (and
+    whatever stores it queries) shares the same weights and tokenizer
+    instead of reloading them.
+
+    Args:
+        model_name: Sentence-transformers model name
+        onnx: Load an int8-quantized ONNX Runtime export instead of
+            the PyTorch model
+
+    Returns:
+        SentenceTransformer, or OnnxEmbeddingGenerator if onnx is set
+    """
+    if onnx:
+        from .embeddings import OnnxEmbeddingGenerator
+        return OnnxEmbeddingGenerator(model_name, quantize=True)
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_encoding(model_name: str):
+    """
+    tiktoken encoding for an OpenAI model, loaded once per process.
+
+    Returns:
+        tiktoken Encoding, or None if tiktoken is missing or the encoding
+        cannot be loaded (it is downloaded on first use)
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"⚠️  Could not load tiktoken encoding, approximating token counts: {e}")
+        return None
 
 
 class PathWayRAG:
@@ -97,13 +1340,92 @@ class PathWayRAG:
     PathWay RAG system using LangChain.
     """
 
+    # Query text -> embedding entries kept in memory
+    QUERY_CACHE_SIZE = 1024
+
+    # Seconds a cached LLM response stays valid
+    LLM_CACHE_EXPIRE = 86400
+
+    # Part of every LLM cache key; bump it when prompts or answer
+    # handling change so stale cached responses are not served
+    PROMPT_VERSION = 1
+
+    # Token budget for the whole planning prompt; the retrieved contexts
+    # share whatever the filled-in template leaves
+    PLAN_PROMPT_TOKENS = 1300
+
+    # Characters per token assumed when no tiktoken encoding is available
+    CHARS_PER_TOKEN = 4
+
+    # Values of self.src, the per-row store of the merged matrix
+    SOURCE_PROFESSOR = 0
+    SOURCE_PROGRAM = 1
+
+    # Prompts are parsed once, at class definition, not per call
+    _QA_PROMPT = ChatPromptTemplate.from_messages([
+        ("system", """You are PathWay, an intelligent academic advisor for Columbia Engineering programs.
+
+Your role is to help students understand degree requirements, course options, and professor recommendations.
+
+Guidelines:
+1. Answer based ONLY on the provided context
+2. Cite sources using [Source X] format
+3. If information is not in the context, say "I don't have that information"
+4. Be concise and clear
+5. Always include a disclaimer to verify with official advisors
+
+Remember: You are a helpful tool, not a replacement for official advising."""),
+        ("human", """Context:
+{context}
+
+Question: {question}
+
+Please provide a helpful answer based on the context above. Include source citations.""")
+    ])
+
+    _PLAN_PROMPT = ChatPromptTemplate.from_messages([
+        ("system", """You are PathWay, an academic planning assistant.
+
+Create a realistic semester-by-semester course plan based on the degree requirements and professor ratings provided.
+
+Guidelines:
+1. Follow the degree requirements strictly
+2. Suggest 3-4 courses per semester (9-12 credits typical)
+3. When professor ratings are available, recommend higher-rated professors
+4. Include planning notes and assumptions
+5. Format the plan clearly with semesters and courses
+
+Output format:
+Semester 1: Fall 2025
+- Course 1 (recommended professor if available)
+- Course 2
+...
+
+Notes:
+- List any assumptions or caveats"""),
+        ("human", """Program: {program}
+Completed courses: {completed}
+Target: {semesters} semesters
+Preference: {preference}
+
+Program Requirements:
+{requirements}
+
+Professor Ratings:
+{professors}
+
+Please create a personalized course plan.""")
+    ])
+
     def __init__(
         self,
         openai_api_key: str,
         professor_db_path: str = "vector_db_simple",
         programs_db_path: str = "vector_db_programs",
         model_name: str = "gpt-4",
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        onnx_embedder: bool = False,
+        llm_cache_dir: Optional[str] = None
     ):
         """
         Initialize PathWay RAG system.
@@ -114,6 +1436,14 @@ class PathWayRAG:
             programs_db_path: Path to programs vector database
             model_name: LLM model name
             temperature: LLM temperature
+            onnx_embedder: Embed queries with an int8-quantized ONNX
+                Runtime export of the model instead of PyTorch (needs
+                optimum[onnxruntime])
+            llm_cache_dir: Directory for the on-disk LLM response cache
+                (needs diskcache), e.g. "llm_cache". Identical prompts
+                (same model, prompt version, context and question) are
+                answered from disk for LLM_CACHE_EXPIRE seconds. None
+                (the default) disables caching
         """
         print("Initializing PathWay RAG with LangChain...")
 
@@ -123,6 +1453,7 @@ class PathWayRAG:
         # Load vector stores
         self.prof_store = SimpleVectorStore(professor_db_path)
         self.programs_store = SimpleVectorStore(programs_db_path)
+        self._build_merged_index()
 
         # Initialize LLM
         self.llm = ChatOpenAI(
@@ -130,13 +1461,237 @@ class PathWayRAG:
             temperature=temperature,
             api_key=openai_api_key
         )
+        self.model_name = model_name
+        self.temperature = temperature
+        self.encoding = _get_encoding(model_name)
 
-        # Initialize embeddings (for queries)
-        from sentence_transformers import SentenceTransformer
-        self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.llm_cache = None
+        if llm_cache_dir and diskcache is not None:
+            self.llm_cache = diskcache.Cache(llm_cache_dir)
+
+        # Initialize embeddings (for queries), shared across instances
+        self.onnx_embedder = onnx_embedder
+        self.embedder = _get_embedder('sentence-transformers/all-MiniLM-L6-v2', onnx_embedder)
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # aretrieve_context encodes from worker threads
+        self._query_cache_lock = threading.Lock()
 
         print("✅ PathWay RAG initialized")
 
+    def _encode_queries(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        Embed queries, unit-normalized, in one forward pass.
+
+        Recently seen queries are served from an LRU cache; cached vectors
+        are read-only. The cache is locked for lookups and updates, but
+        not while the model runs.
+        """
+        found = {}
+        with self._query_cache_lock:
+            for query in dict.fromkeys(queries):
+                embedding = self._query_cache.get(query)
+                if embedding is not None:
+                    self._query_cache.move_to_end(query)
+                    found[query] = embedding
+        misses = [query for query in dict.fromkeys(queries) if query not in found]
+
+        if misses:
+            if self.onnx_embedder:
+                # OnnxEmbeddingGenerator output is already unit-norm
+                embeddings = self.embedder.encode(misses, batch_size=32)
+            else:
+                embeddings = self.embedder.encode(
+                    misses,
+                    batch_size=32,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+            for query, embedding in zip(misses, embeddings):
+                embedding.flags.writeable = False
+                found[query] = embedding
+            with self._query_cache_lock:
+                for query in misses:
+                    self._query_cache[query] = found[query]
+                while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        return [found[query] for query in queries]
+
+    def _generate(self, prompt_template: ChatPromptTemplate, inputs: Dict[str, Any]) -> str:
+        """
+        Run the prompt through the LLM, serving repeated prompts from the
+        disk cache.
+
+        Args:
+            prompt_template: Chat prompt to fill
+            inputs: Template variables
+
+        Returns:
+            LLM response text
+        """
+        messages = prompt_template.format_messages(**inputs)
+        if self.llm_cache is None:
+            return (self.llm | StrOutputParser()).invoke(messages)
+
+        key = self._llm_cache_key(messages)
+        response = self.llm_cache.get(key)
+        if response is None:
+            response = (self.llm | StrOutputParser()).invoke(messages)
+            self.llm_cache.set(key, response, expire=self.LLM_CACHE_EXPIRE)
+        else:
+            print("   ⚡ LLM response served from cache")
+        return response
+
+    def _generate_stream(
+        self,
+        prompt_template: ChatPromptTemplate,
+        inputs: Dict[str, Any]
+    ) -> Iterator[str]:
+        """
+        Like _generate, but yield the response text as the LLM produces it.
+        A cached response is yielded whole; a fresh one is cached once the
+        stream completes.
+        """
+        messages = prompt_template.format_messages(**inputs)
+        key = self._llm_cache_key(messages) if self.llm_cache is not None else None
+
+        if key is not None:
+            response = self.llm_cache.get(key)
+            if response is not None:
+                print("   ⚡ LLM response served from cache")
+                yield response
+                return
+
+        pieces = []
+        for piece in (self.llm | StrOutputParser()).stream(messages):
+            pieces.append(piece)
+            yield piece
+
+        if key is not None:
+            self.llm_cache.set(key, "".join(pieces), expire=self.LLM_CACHE_EXPIRE)
+
+    def _llm_cache_key(self, messages) -> str:
+        """
+        Key on everything that shapes the response: model settings, the
+        prompt version and the fully rendered system prompt, context and
+        question.
+        """
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(f"{self.model_name}|{self.temperature}|{self.PROMPT_VERSION}".encode())
+        for message in messages:
+            digest.update(b"\0" + message.type.encode() + b"\0" + message.content.encode())
+        return digest.hexdigest()
+
+    def _count_tokens(self, text: str) -> int:
+        """Number of tokens the LLM sees for text."""
+        if self.encoding is None:
+            return -(-len(text) // self.CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text))
+
+    def _truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens, on a token boundary."""
+        max_tokens = max(max_tokens, 0)
+        if self.encoding is None:
+            return text[:max_tokens * self.CHARS_PER_TOKEN]
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def _build_merged_index(self):
+        """
+        Stack both stores' embeddings into one matrix, with self.src giving
+        each row's store, so a general query is scored in a single pass.
+
+        Only built when both stores use exact search; HNSW and GPU indexes
+        already answer top-k without scanning the matrices.
+        """
+        self.all_emb = None
+        self.all_i8 = None
+        self.src = None
+        stores = (self.prof_store, self.programs_store)
+        if any(store.indexed for store in stores):
+            return
+
+        self.all_emb = np.vstack([store.embeddings_normed for store in stores])
+        if all(store.emb_i8 is not None for store in stores):
+            self.all_i8 = np.vstack([store.emb_i8 for store in stores])
+        self.src = np.concatenate([
+            np.full(len(self.prof_store.texts), self.SOURCE_PROFESSOR),
+            np.full(len(self.programs_store.texts), self.SOURCE_PROGRAM)
+        ]).astype(np.int8)
+
+    def _search_all(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        source: Optional[int] = None,
+        similarities: Optional[np.ndarray] = None
+    ) -> List[Document]:
+        """
+        Exact top-k over the merged matrix.
+
+        Args:
+            query_embedding: Query embedding vector
+            k: Number of results
+            source: Restrict results to SOURCE_PROFESSOR or SOURCE_PROGRAM
+            similarities: Scores from a previous call with the same query,
+                to search another source without rescoring
+
+        Returns:
+            List of LangChain Document objects, most similar first
+        """
+        if similarities is None:
+            similarities = _cosine_scores(query_embedding, self.all_emb, self.all_i8)
+
+        if source is not None:
+            candidates = np.flatnonzero(self.src == source)
+        else:
+            candidates = np.arange(len(self.src))
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+        candidates = candidates[np.argpartition(-similarities[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        num_prof = len(self.prof_store.texts)
+        results = []
+        for idx in candidates:
+            store, row = (self.prof_store, idx) if idx < num_prof else (self.programs_store, idx - num_prof)
+            results.append(Document(
+                page_content=store.texts[row],
+                metadata={
+                    **store.metadatas[row],
+                    'similarity': float(similarities[idx])
+                }
+            ))
+        return results
+
+    def _search(
+        self,
+        query_embedding: np.ndarray,
+        query_type: str,
+        k: int
+    ) -> List[Document]:
+        """Search the store(s) for a query type with a precomputed embedding."""
+        if query_type == "professor":
+            return self.prof_store.similarity_search(query_embedding, k=k, presume_normalized=True)
+        elif query_type == "program":
+            return self.programs_store.similarity_search(query_embedding, k=k, presume_normalized=True)
+
+        if self.all_emb is not None:
+            # Score both stores in one pass, then take each one's share
+            similarities = _cosine_scores(query_embedding, self.all_emb, self.all_i8)
+            return (
+                self._search_all(query_embedding, k//2, self.SOURCE_PROFESSOR, similarities)
+                + self._search_all(query_embedding, k//2, self.SOURCE_PROGRAM, similarities)
+            )
+
+        # Search both and combine
+        prof_docs = self.prof_store.similarity_search(query_embedding, k=k//2, presume_normalized=True)
+        prog_docs = self.programs_store.similarity_search(query_embedding, k=k//2, presume_normalized=True)
+        return prof_docs + prog_docs
+
     def retrieve_context(
         self,
         query: str,
@@ -154,21 +1709,79 @@ class PathWayRAG:
         Returns:
             List of relevant documents
         """
-        # Generate query embedding
-        query_embedding = self.embedder.encode(query)
+        query_embedding = self._encode_queries([query])[0]
+        return self._search(query_embedding, query_type, k)
 
-        # Choose appropriate database
-        if query_type == "professor":
-            docs = self.prof_store.similarity_search(query_embedding, k=k)
-        elif query_type == "program":
-            docs = self.programs_store.similarity_search(query_embedding, k=k)
-        else:
-            # Search both and combine
-            prof_docs = self.prof_store.similarity_search(query_embedding, k=k//2)
-            prog_docs = self.programs_store.similarity_search(query_embedding, k=k//2)
-            docs = prof_docs + prog_docs
+    async def aretrieve_context(
+        self,
+        query: str,
+        query_type: str = "general",
+        k: int = 5
+    ) -> List[Document]:
+        """
+        Async retrieve_context. Embedding and search run on worker threads
+        so the event loop stays free; for general queries on HNSW stores
+        (no merged matrix) the two stores are searched concurrently.
+
+        Args:
+            query: User query
+            query_type: 'professor', 'program', or 'general'
+            k: Number of documents to retrieve
+
+        Returns:
+            List of relevant documents
+        """
+        embeddings = await asyncio.to_thread(self._encode_queries, [query])
+        query_embedding = embeddings[0]
+
+        if query_type != "general" or self.all_emb is not None:
+            return await asyncio.to_thread(self._search, query_embedding, query_type, k)
+
+        # FAISS, hnswlib and BLAS release the GIL, so both searches overlap
+        prof_docs, prog_docs = await asyncio.gather(
+            asyncio.to_thread(
+                self.prof_store.similarity_search, query_embedding, k//2, presume_normalized=True
+            ),
+            asyncio.to_thread(
+                self.programs_store.similarity_search, query_embedding, k//2, presume_normalized=True
+            )
+        )
+        return prof_docs + prog_docs
+
+    def retrieve_context_batch(
+        self,
+        requests: List[Tuple[str, str, int]]
+    ) -> List[List[Document]]:
+        """
+        Retrieve context for several queries, embedding them together.
+
+        Args:
+            requests: (query, query_type, k) tuples, as for retrieve_context
+
+        Returns:
+            List of document lists, one per request
+        """
+        embeddings = self._encode_queries([query for query, _, _ in requests])
+        results: List[Optional[List[Document]]] = [None] * len(requests)
+
+        # Single-store requests with the same k go to their store as one
+        # batch, so GPU and FAISS indexes search them in a single call
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for i, (_, query_type, k) in enumerate(requests):
+            if query_type in ("professor", "program"):
+                groups.setdefault((query_type, k), []).append(i)
+        for (query_type, k), positions in groups.items():
+            store = self.prof_store if query_type == "professor" else self.programs_store
+            batch = store.similarity_search_batch(
+                np.stack([embeddings[i] for i in positions]), k=k, presume_normalized=True
+            )
+            for i, docs in zip(positions, batch):
+                results[i] = docs
 
-        return docs
+        for i, (embedding, (_, query_type, k)) in enumerate(zip(embeddings, requests)):
+            if results[i] is None:
+                results[i] = self._search(embedding, query_type, k)
+        return results
 
     def format_context(self, docs: List[Document]) -> str:
         """Format retrieved documents as context string."""
@@ -192,7 +1805,8 @@ class PathWayRAG:
         self,
         question: str,
         query_type: str = "general",
-        k: int = 5
+        k: int = 5,
+        stream: bool = False
     ) -> Dict[str, Any]:
         """
         Answer a question using RAG.
@@ -201,6 +1815,9 @@ class PathWayRAG:
             question: User question
             query_type: Type of query
             k: Number of context documents
+            stream: Return the answer as an iterator of text chunks,
+                yielded as the LLM generates them, instead of a string.
+                Sources are available before the first chunk arrives
 
         Returns:
             Dictionary with answer and sources
@@ -213,44 +1830,18 @@ class PathWayRAG:
 
         print(f"   Retrieved {len(docs)} relevant documents")
 
-        # Build prompt
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """You are PathWay, an intelligent academic advisor for Columbia Engineering programs.
-
-Your role is to help students understand degree requirements, course options, and professor recommendations.
-
-Guidelines:
-1. Answer based ONLY on the provided context
-2. Cite sources using [Source X] format
-3. If information is not in the context, say "I don't have that information"
-4. Be concise and clear
-5. Always include a disclaimer to verify with official advisors
-
-Remember: You are a helpful tool, not a replacement for official advising."""),
-            ("human", """Context:
-{context}
-
-Question: {question}
-
-Please provide a helpful answer based on the context above. Include source citations.""")
-        ])
-
-        # Create RAG chain
-        rag_chain = (
-            {
-                "context": lambda x: context,
-                "question": RunnablePassthrough()
-            }
-            | prompt_template
-            | self.llm
-            | StrOutputParser()
-        )
+        inputs = {
+            "context": context,
+            "question": question
+        }
 
         # Generate answer
         print("   Generating answer with LLM...")
-        answer = rag_chain.invoke(question)
-
-        print("   ✅ Answer generated")
+        if stream:
+            answer = self._generate_stream(self._QA_PROMPT, inputs)
+        else:
+            answer = self._generate(self._QA_PROMPT, inputs)
+            print("   ✅ Answer generated")
 
         return {
             "question": question,
@@ -285,25 +1876,23 @@ Please provide a helpful answer based on the context above. Include source citat
         query = f"highly rated professors {course_name}" if course_name else "best professors"
 
         # Get query embedding
-        query_embedding = self.embedder.encode(query)
+        query_embedding = self._encode_queries([query])[0]
 
-        # Search professor database
-        docs = self.prof_store.similarity_search(query_embedding, k=k*2)
+        # Most similar professors at or above the rating threshold, found
+        # in a single compiled pass over the similarity vector
+        indices, _ = self.prof_store.top_k_by_rating(
+            query_embedding, min_rating, k, presume_normalized=True
+        )
 
-        # Filter by rating
         results = []
-        for doc in docs:
-            rating = doc.metadata.get('rating', 0)
-            if rating >= min_rating:
-                results.append({
-                    'professor': doc.metadata.get('professor_name'),
-                    'rating': rating,
-                    'course': doc.metadata.get('course_code', 'N/A'),
-                    'text': doc.page_content
-                })
-
-            if len(results) >= k:
-                break
+        for idx in indices:
+            metadata = self.prof_store.metadatas[idx]
+            results.append({
+                'professor': metadata.get('professor_name'),
+                'rating': metadata.get('rating', 0),
+                'course': metadata.get('course_code', 'N/A'),
+                'text': self.prof_store.texts[idx]
+            })
 
         # Sort by rating
         results.sort(key=lambda x: x['rating'], reverse=True)
@@ -331,62 +1920,40 @@ Please provide a helpful answer based on the context above. Include source citat
         """
         print(f"\n📅 Generating plan for: {program}")
 
-        # Retrieve program requirements
+        # Retrieve program requirements and professor ratings, embedding
+        # both queries in a single forward pass
         req_query = f"degree requirements courses for {program}"
-        req_docs = self.retrieve_context(req_query, query_type="program", k=8)
-        req_context = self.format_context(req_docs)
-
-        # Get professor ratings
         prof_query = f"professors teaching courses"
-        prof_docs = self.retrieve_context(prof_query, query_type="professor", k=10)
-        prof_context = self.format_context(prof_docs)
-
-        # Build planning prompt
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """You are PathWay, an academic planning assistant.
-
-Create a realistic semester-by-semester course plan based on the degree requirements and professor ratings provided.
-
-Guidelines:
-1. Follow the degree requirements strictly
-2. Suggest 3-4 courses per semester (9-12 credits typical)
-3. When professor ratings are available, recommend higher-rated professors
-4. Include planning notes and assumptions
-5. Format the plan clearly with semesters and courses
-
-Output format:
-Semester 1: Fall 2025
-- Course 1 (recommended professor if available)
-- Course 2
-...
-
-Notes:
-- List any assumptions or caveats"""),
-            ("human", """Program: {program}
-Completed courses: {completed}
-Target: {semesters} semesters
-Preference: {preference}
-
-Program Requirements:
-{requirements}
-
-Professor Ratings:
-{professors}
-
-Please create a personalized course plan.""")
+        req_docs, prof_docs = self.retrieve_context_batch([
+            (req_query, "program", 8),
+            (prof_query, "professor", 10),
         ])
+        req_context = self.format_context(req_docs)
+        prof_context = self.format_context(prof_docs)
 
-        # Generate plan
-        plan_chain = prompt_template | self.llm | StrOutputParser()
-
-        plan = plan_chain.invoke({
+        inputs = {
             "program": program,
             "completed": ", ".join(completed_courses) if completed_courses else "None",
             "semesters": target_semesters,
             "preference": "Prefer highly-rated professors" if prefer_high_rated else "Balanced",
-            "requirements": req_context[:2000],  # Limit context size
-            "professors": prof_context[:2000]
-        })
+            "requirements": "",
+            "professors": ""
+        }
+
+        # Limit context size: fit both contexts into the tokens the filled
+        # template leaves, requirements first, professors taking the rest
+        fixed_tokens = sum(
+            self._count_tokens(message.content)
+            for message in self._PLAN_PROMPT.format_messages(**inputs)
+        )
+        available = self.PLAN_PROMPT_TOKENS - fixed_tokens
+        inputs["requirements"] = self._truncate_tokens(req_context, available // 2)
+        inputs["professors"] = self._truncate_tokens(
+            prof_context, available - self._count_tokens(inputs["requirements"])
+        )
+
+        # Generate plan
+        plan = self._generate(self._PLAN_PROMPT, inputs)
 
         print("   ✅ Plan generated")
 
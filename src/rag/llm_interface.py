@@ -3,11 +3,32 @@ LLM interface module for generating responses.
 Updated for google-genai 1.x and modern LangChain standards.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import Awaitable, Callable, List, Dict, Any, Iterator, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
 import logging
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
 from enum import Enum
 import os
 
+try:
+    from google import genai
+    from google.genai import types as genai_types
+except ImportError:
+    genai = None
+    genai_types = None
+
+try:
+    from openai import AsyncOpenAI, OpenAI
+except ImportError:
+    AsyncOpenAI = None
+    OpenAI = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -19,9 +40,148 @@ class LLMProvider(Enum):
     GEMINI = "gemini"
 
 
+class _ResponseCache:
+    """
+    In-process cache of LLM responses, keyed on a hash of the request,
+    with expiry. Shared by every LLMInterface in the process.
+    """
+
+    MAX_SIZE = 1000
+    TTL = 24 * 3600  # seconds
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    _WHITESPACE_RE = re.compile(r"\s+")
+
+    @classmethod
+    def canonicalize(cls, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Messages reduced to role and whitespace-collapsed content, so
+        prompts that differ only in spacing or dict key order share a key.
+        Case is kept: course codes and names in the context are
+        case-sensitive.
+        """
+        return [
+            {"role": msg["role"], "content": cls._WHITESPACE_RE.sub(" ", msg["content"]).strip()}
+            for msg in messages
+        ]
+
+    @classmethod
+    def key(
+        cls,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        messages: List[Dict[str, str]],
+        canonicalize: bool = True
+    ) -> str:
+        """sha256 of everything that determines a response."""
+        if canonicalize:
+            messages = cls.canonicalize(messages)
+        payload = json.dumps(
+            {"model": model, "t": temperature, "mt": max_tokens, "msgs": messages},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expiry = entry
+            if expiry < time.time():
+                del self._entries[key]
+                return None
+            return response
+
+    def put(self, key: str, response: str):
+        """Cache a response, evicting the oldest entry when full."""
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.MAX_SIZE:
+                oldest = min(self._entries.items(), key=lambda kv: kv[1][1])[0]
+                del self._entries[oldest]
+            self._entries[key] = (response, time.time() + self.TTL)
+
+
+_response_cache = _ResponseCache()
+
+
+class _InflightCalls:
+    """
+    Coalesces concurrent identical LLM requests ("singleflight"). The
+    first caller for a key makes the API call; callers arriving with the
+    same key while it is in flight wait for that result instead of
+    issuing their own. Complements _response_cache, which only helps
+    once a response has come back.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, Future] = {}
+        self._tasks: Dict[Tuple[int, str], "asyncio.Task"] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Optional[str], call: Callable[[], str]) -> str:
+        """Run call() once per key across concurrent threads."""
+        if key is None:
+            return call()
+
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    async def arun(self, key: Optional[str], call: Callable[[], Awaitable[str]]) -> str:
+        """Await call() once per key across concurrent coroutines."""
+        if key is None:
+            return await call()
+
+        # The shared call runs as its own task, so a caller that is
+        # cancelled (e.g. the client disconnected) does not cancel it for
+        # the others
+        task_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        return await asyncio.shield(task)
+
+
+_inflight_calls = _InflightCalls()
+
+
 class LLMInterface:
     """Base interface for LLM interactions."""
 
+    # Responses are cached only at or below this temperature; reusing a
+    # high-temperature sample would hide the variety the caller asked for
+    CACHE_MAX_TEMPERATURE = 0.3
+
+    # Collapse whitespace in messages before computing cache keys. Turn
+    # off for prompts where whitespace is meaningful (e.g. code)
+    CACHE_CANONICALIZE = True
+
     def generate(
         self,
         messages: List[Dict[str, str]],
@@ -31,29 +191,231 @@ class LLMInterface:
         """Generate a response from the LLM."""
         raise NotImplementedError
 
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> str:
+        """
+        Async generate(). Providers with an async client override this;
+        the default runs generate() in a worker thread so it does not
+        block the event loop.
+        """
+        return await asyncio.to_thread(
+            self.generate, messages, temperature=temperature, max_tokens=max_tokens
+        )
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        """
+        Generate a response as a stream of text chunks, so callers can
+        render output before the completion finishes. Providers with
+        token streaming override this; the default yields the whole
+        generate() response as a single chunk.
+        """
+        yield self.generate(messages, temperature=temperature, max_tokens=max_tokens)
+
+    @staticmethod
+    def _cache_stream(chunks: Iterator[str], cache_key: Optional[str]) -> Iterator[str]:
+        """Pass chunks through, caching the full text once the stream completes."""
+        parts = []
+        for chunk in chunks:
+            if chunk:
+                parts.append(chunk)
+                yield chunk
+        if cache_key is not None and parts:
+            _response_cache.put(cache_key, "".join(parts))
+
+    def generate_batch(
+        self,
+        messages_list: List[List[Dict[str, str]]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> List[str]:
+        """
+        Generate responses for several independent prompts.
+
+        Providers with a batch API override this; the default simply
+        calls generate() for each prompt in turn.
+
+        Args:
+            messages_list: One message list per prompt
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens per response
+
+        Returns:
+            Responses in the same order as messages_list
+        """
+        return [
+            self.generate(messages, temperature=temperature, max_tokens=max_tokens)
+            for messages in messages_list
+        ]
+
+    def _cached_responses(
+        self,
+        model: str,
+        messages_list: List[List[Dict[str, str]]],
+        temperature: float,
+        max_tokens: int
+    ) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """
+        Response cache lookups for a batch.
+
+        Returns:
+            Tuple of (cache keys, cached responses), None where missing
+        """
+        keys = [self._cache_key(model, messages, temperature, max_tokens) for messages in messages_list]
+        cached = [_response_cache.get(key) if key is not None else None for key in keys]
+        return keys, cached
+
+    def _cache_key(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> Optional[str]:
+        """Response cache key for a request, or None if it must not be cached."""
+        if temperature > self.CACHE_MAX_TEMPERATURE:
+            return None
+        return _response_cache.key(
+            model, temperature, max_tokens, messages, canonicalize=self.CACHE_CANONICALIZE
+        )
+
 
 class GeminiInterface(LLMInterface):
     """Interface for Google Gemini models using the unified google-genai SDK."""
 
+    BATCH_POLL_INTERVAL = 30  # seconds
+    BATCH_TIMEOUT = 24 * 3600  # seconds
+    _BATCH_DONE_STATES = {
+        "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED",
+        "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"
+    }
+
+    # Stable system instructions are uploaded once as CachedContent and
+    # referenced by name, so Gemini does not re-tokenize them per call
+    CONTEXT_CACHE_TTL = 3600  # seconds
+    CONTEXT_CACHE_REFRESH_MARGIN = 300  # extend the TTL this long before expiry
+    # Gemini rejects CachedContent below a per-model token minimum (1024
+    # at the lowest); shorter instructions are sent inline without trying
+    CONTEXT_CACHE_MIN_TOKENS = 1024
+    CHARS_PER_TOKEN = 4  # rough local estimate, no count_tokens round trip
+
     def __init__(self, api_key: str, model: str = "models/gemini-2.5-pro"):
         """
         Initialize Gemini interface.
         """
+        if genai is None:
+            raise ImportError("google-genai package not installed. Run: pip install google-genai")
+
+        # The new SDK uses a Client object
+        self.client = genai.Client(api_key=api_key)
+        self.async_client = self.client.aio
+
+        # Listing models is a full API round trip, so only do it when
+        # someone will see the output
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Available Gemini models:")
+            for m in self.client.models.list():
+                logger.debug(f"  {m.name}")
+
+        self.model_id = model
+        logger.info(f"Initialized Gemini interface with model: {model}")
+
+        # sha256(system instruction) -> [cache name, expiry timestamp].
+        # Caches are created on first use of an instruction, not here
+        self._context_caches: Dict[str, List[Any]] = {}
+        # Instructions being uploaded, or that are not cached (too short,
+        # or the upload failed)
+        self._context_cache_skip: Set[str] = set()
+        self._context_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _instruction_key(system_instruction: str) -> str:
+        return hashlib.sha256(system_instruction.encode()).hexdigest()
+
+    def _create_context_cache(self, key: str, system_instruction: str):
+        """
+        Upload a system instruction as CachedContent. Failures (e.g. a
+        prompt below the model's minimum cacheable size) are logged once
+        and the instruction is sent inline from then on.
+        """
         try:
-            from google import genai
+            cache = self.client.caches.create(
+                model=self.model_id,
+                config=genai_types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{self.CONTEXT_CACHE_TTL}s",
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Could not create Gemini context cache: {e}")
+            return
+
+        with self._context_cache_lock:
+            self._context_caches[key] = [cache.name, time.time() + self.CONTEXT_CACHE_TTL]
+            self._context_cache_skip.discard(key)
+        logger.info(f"Created Gemini context cache {cache.name}")
 
-            # The new SDK uses a Client object
-            self.client = genai.Client(api_key=api_key)
+    def _refresh_context_cache(self, key: str, name: str):
+        """Extend a context cache's TTL; drop it if that fails."""
+        try:
+            self.client.caches.update(
+                name=name,
+                config=genai_types.UpdateCachedContentConfig(ttl=f"{self.CONTEXT_CACHE_TTL}s")
+            )
+            with self._context_cache_lock:
+                if key in self._context_caches:
+                    self._context_caches[key][1] = time.time() + self.CONTEXT_CACHE_TTL
+        except Exception as e:
+            logger.warning(f"Could not refresh Gemini context cache {name}: {e}")
+            self._drop_context_cache(key)
 
-            # List available models
-            logger.info("Available Gemini models:")
-            for m in list(self.client.models.list()):
-                logger.info(f"  {m.name}")
+    def _drop_context_cache(self, key: str):
+        with self._context_cache_lock:
+            self._context_caches.pop(key, None)
 
-            self.model_id = model
-            logger.info(f"Initialized Gemini interface with model: {model}")
-        except ImportError:
-            raise ImportError("google-genai package not installed. Run: pip install google-genai")
+    def _context_cache_for(self, system_instruction: Optional[str]) -> Optional[str]:
+        """
+        Name of the live context cache holding this system instruction,
+        or None if it has to be sent inline. The first use of a long
+        enough instruction starts uploading it in the background.
+        """
+        if not system_instruction:
+            return None
+
+        key = self._instruction_key(system_instruction)
+        with self._context_cache_lock:
+            entry = self._context_caches.get(key)
+            if entry is None:
+                if key not in self._context_cache_skip:
+                    self._context_cache_skip.add(key)
+                    num_tokens = len(system_instruction) // self.CHARS_PER_TOKEN
+                    if num_tokens >= self.CONTEXT_CACHE_MIN_TOKENS:
+                        threading.Thread(
+                            target=self._create_context_cache,
+                            args=(key, system_instruction),
+                            daemon=True
+                        ).start()
+                return None
+            name, expiry = entry
+            remaining = expiry - time.time()
+            if remaining <= 0:
+                del self._context_caches[key]
+                return None
+            if remaining < self.CONTEXT_CACHE_REFRESH_MARGIN:
+                # Push the expiry out now so only one refresh is started
+                entry[1] = time.time() + self.CONTEXT_CACHE_REFRESH_MARGIN
+                threading.Thread(
+                    target=self._refresh_context_cache, args=(key, name), daemon=True
+                ).start()
+        return name
 
     def generate(
         self,
@@ -64,44 +426,277 @@ class GeminiInterface(LLMInterface):
         """
         Generate a response using Gemini API.
         """
+        cache_key = self._cache_key(self.model_id, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return _inflight_calls.run(
+            cache_key,
+            lambda: self._generate_uncached(messages, temperature, max_tokens, cache_key)
+        )
+
+    def _generate_uncached(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        cache_key: Optional[str]
+    ) -> str:
+        """Gemini API call behind generate(); caches successful responses."""
+        try:
+            system_instruction, history = self._split_messages(messages)
+
+            # A cached system instruction is referenced by name instead
+            # of inlined
+            cached_content = self._context_cache_for(system_instruction)
+            config = self._generate_config(system_instruction, temperature, max_tokens, cached_content)
+
+            try:
+                response = self.client.models.generate_content(
+                    model=self.model_id,
+                    contents=history,
+                    config=config
+                )
+            except Exception:
+                if cached_content is None:
+                    raise
+                # The cache may have been evicted server-side; forget it
+                # and resend the instruction inline
+                logger.warning(f"Gemini context cache {cached_content} failed, sending system instruction inline")
+                self._drop_context_cache(self._instruction_key(system_instruction))
+                response = self.client.models.generate_content(
+                    model=self.model_id,
+                    contents=history,
+                    config=self._generate_config(system_instruction, temperature, max_tokens)
+                )
+
+            if cache_key is not None and response.text is not None:
+                _response_cache.put(cache_key, response.text)
+            return response.text
+        except Exception as e:
+            logger.error(f"Error generating Gemini response: {e}")
+            if os.environ.get("DEBUG"):
+                raise e
+            return f"Error: {str(e)}"
+
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> str:
+        """
+        Generate a response using the async Gemini client.
+        """
+        cache_key = self._cache_key(self.model_id, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return await _inflight_calls.arun(
+            cache_key,
+            lambda: self._agenerate_uncached(messages, temperature, max_tokens, cache_key)
+        )
+
+    async def _agenerate_uncached(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        cache_key: Optional[str]
+    ) -> str:
+        """Async Gemini API call behind agenerate(); caches successful responses."""
         try:
-            from google import genai
-            from google.genai import types
+            system_instruction, history = self._split_messages(messages)
+            cached_content = self._context_cache_for(system_instruction)
+            config = self._generate_config(system_instruction, temperature, max_tokens, cached_content)
+
+            try:
+                response = await self.async_client.models.generate_content(
+                    model=self.model_id,
+                    contents=history,
+                    config=config
+                )
+            except Exception:
+                if cached_content is None:
+                    raise
+                logger.warning(f"Gemini context cache {cached_content} failed, sending system instruction inline")
+                self._drop_context_cache(self._instruction_key(system_instruction))
+                response = await self.async_client.models.generate_content(
+                    model=self.model_id,
+                    contents=history,
+                    config=self._generate_config(system_instruction, temperature, max_tokens)
+                )
+
+            if cache_key is not None and response.text is not None:
+                _response_cache.put(cache_key, response.text)
+            return response.text
+        except Exception as e:
+            logger.error(f"Error generating Gemini response: {e}")
+            if os.environ.get("DEBUG"):
+                raise e
+            return f"Error: {str(e)}"
 
-            # Separate System message from User/Assistant history
-            system_instruction = None
-            history = []
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        """
+        Stream a response from the Gemini API chunk by chunk.
+        """
+        cache_key = self._cache_key(self.model_id, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        system_instruction = None
+        cached_content = None
+        try:
+            system_instruction, history = self._split_messages(messages)
+            cached_content = self._context_cache_for(system_instruction)
+            stream = self.client.models.generate_content_stream(
+                model=self.model_id,
+                contents=history,
+                config=self._generate_config(system_instruction, temperature, max_tokens, cached_content)
+            )
+            yield from self._cache_stream((chunk.text for chunk in stream), cache_key)
+        except Exception as e:
+            logger.error(f"Error streaming Gemini response: {e}")
+            if cached_content is not None:
+                # Send the instruction inline next time in case the
+                # cache was evicted server-side
+                self._drop_context_cache(self._instruction_key(system_instruction))
+            if os.environ.get("DEBUG"):
+                raise e
+            yield f"Error: {str(e)}"
 
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_instruction = msg["content"]
-                else:
-                    # The new SDK expects role to be "user" or "model"
-                    role = "user" if msg["role"] == "user" else "model"
-                    history.append(types.Content(
-                        role=role,
-                        parts=[types.Part.from_text(text=msg["content"])]
-                    ))
-
-            # Modern configuration using GenerateContentConfig
-            config = types.GenerateContentConfig(
-                system_instruction=system_instruction,
+    @staticmethod
+    def _split_messages(messages: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Separate the system message from the user/assistant history.
+
+        History is built in the SDK's dict form rather than as
+        types.Content / types.Part objects, which skips a pydantic
+        validation per message; the SDK converts it the same way.
+
+        Returns:
+            Tuple of (last system instruction or None, list of content dicts)
+        """
+        system_instruction = next(
+            (msg["content"] for msg in reversed(messages) if msg["role"] == "system"),
+            None
+        )
+        # The new SDK expects role to be "user" or "model"
+        history = [
+            {
+                "role": "user" if msg["role"] == "user" else "model",
+                "parts": [{"text": msg["content"]}],
+            }
+            for msg in messages
+            if msg["role"] != "system"
+        ]
+        return system_instruction, history
+
+    @staticmethod
+    def _generate_config(
+        system_instruction: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        cached_content: Optional[str] = None
+    ):
+        """GenerateContentConfig that references cached_content when given."""
+        if cached_content is not None:
+            return genai_types.GenerateContentConfig(
+                cached_content=cached_content,
                 temperature=temperature,
                 max_output_tokens=max_tokens,
             )
+        return genai_types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+        )
+
+    def generate_batch(
+        self,
+        messages_list: List[List[Dict[str, str]]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> List[str]:
+        """
+        Generate responses for several prompts with the Gemini batch API.
+
+        Prompts already in the response cache are not resubmitted. Batch
+        jobs complete asynchronously (possibly hours later) at a reduced
+        price, so this is intended for evaluation runs, not requests.
 
-            response = self.client.models.generate_content(
+        Args:
+            messages_list: One message list per prompt
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens per response
+
+        Returns:
+            Responses in the same order as messages_list
+        """
+        keys, results = self._cached_responses(self.model_id, messages_list, temperature, max_tokens)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        try:
+            inline_requests = []
+            for i in pending:
+                system_instruction, history = self._split_messages(messages_list[i])
+                cached_content = self._context_cache_for(system_instruction)
+                inline_requests.append({
+                    "contents": history,
+                    "config": self._generate_config(system_instruction, temperature, max_tokens, cached_content),
+                })
+
+            job = self.client.batches.create(
                 model=self.model_id,
-                contents=history,
-                config=config
+                src=inline_requests,
+                config={"display_name": f"pathway-batch-{int(time.time())}"},
             )
-
-            return response.text
+            logger.info(f"Submitted Gemini batch {job.name} with {len(pending)} requests")
+
+            deadline = time.time() + self.BATCH_TIMEOUT
+            while job.state.name not in self._BATCH_DONE_STATES:
+                if time.time() > deadline:
+                    raise TimeoutError(f"Gemini batch {job.name} did not finish in time")
+                time.sleep(self.BATCH_POLL_INTERVAL)
+                job = self.client.batches.get(name=job.name)
+
+            if job.state.name != "JOB_STATE_SUCCEEDED":
+                raise RuntimeError(f"Gemini batch {job.name} ended in state {job.state.name}")
+
+            for i, inline_response in zip(pending, job.dest.inlined_responses):
+                if inline_response.response is not None and inline_response.response.text is not None:
+                    results[i] = inline_response.response.text
+                    if keys[i] is not None:
+                        _response_cache.put(keys[i], results[i])
+                else:
+                    results[i] = f"Error: {inline_response.error}"
         except Exception as e:
-            logger.error(f"Error generating Gemini response: {e}")
-            if os.environ["DEBUG"]:
+            logger.error(f"Error running Gemini batch: {e}")
+            if os.environ.get("DEBUG"):
                 raise e
-            return f"Error: {str(e)}"
+            for i in pending:
+                if results[i] is None:
+                    results[i] = f"Error: {str(e)}"
+
+        for i in pending:
+            if results[i] is None:
+                results[i] = "Error: no response returned by batch"
+
+        return results
 
 
 class PromptTemplate:
@@ -110,12 +705,19 @@ class PromptTemplate:
     DEGREE_QA_SYSTEM = """You are PathWay, an academic advisor...""" # Rest of the string
     PLANNING_SYSTEM = """You are PathWay, a planning assistant...""" # Rest of the string
 
+    # User-message skeletons, filled with format_map. The system prompts
+    # above are constants, so every prompt shares a stable prefix
+    QA_USER_TEMPLATE = "Context: {context}\nQuestion: {query}"
+    PLANNING_USER_TEMPLATE = "Task: Create a plan for {program}"
+
     @staticmethod
     def build_qa_prompt(query: str, context: str, user_profile: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
         # ... (rest of the build_qa_prompt logic)
         return [
             {"role": "system", "content": PromptTemplate.DEGREE_QA_SYSTEM},
-            {"role": "user", "content": f"Context: {context}\nQuestion: {query}"}
+            {"role": "user", "content": PromptTemplate.QA_USER_TEMPLATE.format_map(
+                {"context": context, "query": query}
+            )}
         ]
 
     @staticmethod
@@ -123,23 +725,41 @@ class PromptTemplate:
         # ... (rest of the build_planning_prompt logic)
         return [
             {"role": "system", "content": PromptTemplate.PLANNING_SYSTEM},
-            {"role": "user", "content": f"Task: Create a plan for {user_profile.get('program')}"}
+            {"role": "user", "content": PromptTemplate.PLANNING_USER_TEMPLATE.format_map(
+                {"program": user_profile.get('program')}
+            )}
         ]
 
 
 class OpenAIInterface(LLMInterface):
     """Interface for OpenAI models."""
 
+    BATCH_POLL_INTERVAL = 30  # seconds
+    BATCH_TIMEOUT = 24 * 3600  # seconds
+    _BATCH_DONE_STATES = {"completed", "failed", "expired", "cancelled"}
+
     def __init__(self, api_key: str, model: str = "gpt-4"):
-        try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=api_key)
-            self.model = model
-            logger.info(f"Initialized OpenAI interface with model: {model}")
-        except ImportError:
+        if OpenAI is None:
             raise ImportError("openai package not installed. Run: pip install openai")
 
+        self.client = OpenAI(api_key=api_key)
+        self.async_client = AsyncOpenAI(api_key=api_key)
+        self.model = model
+        logger.info(f"Initialized OpenAI interface with model: {model}")
+
     def generate(self, messages, temperature=0.3, max_tokens=2000) -> str:
+        cache_key = self._cache_key(self.model, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return _inflight_calls.run(
+            cache_key,
+            lambda: self._generate_uncached(messages, temperature, max_tokens, cache_key)
+        )
+
+    def _generate_uncached(self, messages, temperature, max_tokens, cache_key) -> str:
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
@@ -147,13 +767,169 @@ class OpenAIInterface(LLMInterface):
                 temperature=temperature,
                 max_tokens=max_tokens
             )
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if cache_key is not None and content is not None:
+                _response_cache.put(cache_key, content)
+            return content
+        except Exception as e:
+            logger.error(f"Error generating OpenAI response: {e}")
+            if os.environ.get("DEBUG"):
+                raise e
+            return f"Error: {str(e)}"
+
+    def generate_stream(self, messages, temperature=0.3, max_tokens=2000) -> Iterator[str]:
+        cache_key = self._cache_key(self.model, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            yield from self._cache_stream(
+                (chunk.choices[0].delta.content for chunk in stream if chunk.choices),
+                cache_key
+            )
+        except Exception as e:
+            logger.error(f"Error streaming OpenAI response: {e}")
+            if os.environ.get("DEBUG"):
+                raise e
+            yield f"Error: {str(e)}"
+
+    async def agenerate(self, messages, temperature=0.3, max_tokens=2000) -> str:
+        cache_key = self._cache_key(self.model, messages, temperature, max_tokens)
+        if cache_key is not None:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        return await _inflight_calls.arun(
+            cache_key,
+            lambda: self._agenerate_uncached(messages, temperature, max_tokens, cache_key)
+        )
+
+    async def _agenerate_uncached(self, messages, temperature, max_tokens, cache_key) -> str:
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content
+            if cache_key is not None and content is not None:
+                _response_cache.put(cache_key, content)
+            return content
         except Exception as e:
             logger.error(f"Error generating OpenAI response: {e}")
-            if os.environ["DEBUG"]:
+            if os.environ.get("DEBUG"):
                 raise e
             return f"Error: {str(e)}"
 
+    def generate_batch(
+        self,
+        messages_list: List[List[Dict[str, str]]],
+        temperature: float = 0.3,
+        max_tokens: int = 2000
+    ) -> List[str]:
+        """
+        Generate responses for several prompts with the OpenAI Batch API.
+
+        Prompts already in the response cache are not resubmitted. Batch
+        jobs complete asynchronously (within 24h) at a reduced price, so
+        this is intended for evaluation runs, not requests. The Batch API
+        needs openai>=1.16; older SDKs (such as the pinned 1.3.5) fall
+        back to one generate() call per prompt.
+
+        Args:
+            messages_list: One message list per prompt
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens per response
+
+        Returns:
+            Responses in the same order as messages_list
+        """
+        if not hasattr(self.client, "batches"):
+            logger.info("openai SDK has no Batch API, generating prompts one at a time")
+            return super().generate_batch(messages_list, temperature=temperature, max_tokens=max_tokens)
+
+        keys, results = self._cached_responses(self.model, messages_list, temperature, max_tokens)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        try:
+            lines = [
+                json.dumps({
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model,
+                        "messages": messages_list[i],
+                        "temperature": temperature,
+                        "max_tokens": max_tokens,
+                    },
+                })
+                for i in pending
+            ]
+            with tempfile.NamedTemporaryFile("w+b", suffix=".jsonl") as f:
+                f.write(("\n".join(lines) + "\n").encode())
+                f.flush()
+                f.seek(0)
+                input_file = self.client.files.create(file=f, purpose="batch")
+
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            logger.info(f"Submitted OpenAI batch {batch.id} with {len(pending)} requests")
+
+            deadline = time.time() + self.BATCH_TIMEOUT
+            while batch.status not in self._BATCH_DONE_STATES:
+                if time.time() > deadline:
+                    raise TimeoutError(f"OpenAI batch {batch.id} did not finish in time")
+                time.sleep(self.BATCH_POLL_INTERVAL)
+                batch = self.client.batches.retrieve(batch.id)
+
+            if batch.status != "completed" or batch.output_file_id is None:
+                raise RuntimeError(f"OpenAI batch {batch.id} ended with status {batch.status}")
+
+            # Output lines are not guaranteed to be in input order
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                i = int(record["custom_id"])
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[i] = response["body"]["choices"][0]["message"]["content"]
+                    if keys[i] is not None and results[i] is not None:
+                        _response_cache.put(keys[i], results[i])
+                else:
+                    results[i] = f"Error: {record.get('error') or response.get('body')}"
+        except Exception as e:
+            logger.error(f"Error running OpenAI batch: {e}")
+            if os.environ.get("DEBUG"):
+                raise e
+            for i in pending:
+                if results[i] is None:
+                    results[i] = f"Error: {str(e)}"
+
+        for i in pending:
+            if results[i] is None:
+                results[i] = "Error: no response returned by batch"
+
+        return results
+
 
 def create_llm_interface(
     provider: str,
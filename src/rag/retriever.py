@@ -2,66 +2,66 @@
 Retrieval module for the RAG system.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
+import threading
+import time
 from .embeddings import EmbeddingGenerator
 from .vector_store import VectorStore
 import re
+import numpy as np
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Department letters followed by a four-digit course number
+_COURSE_RE = re.compile(r"([A-Z]{2,4})(\d{4})")
 
-class ProfessorRatingsRetriever:
-    """Specialized retriever for professor ratings with input normalization."""
 
-    def __init__(self, embedder: EmbeddingGenerator, vector_store: VectorStore):
-        self.embedder = embedder
-        self.vector_store = vector_store
-        logger.info("Initialized ProfessorRatingsRetriever")
+@functools.lru_cache(maxsize=4096)
+def _normalize_course_code(course_code: str) -> str:
+    """Memoized body of ProfessorRatingsRetriever.normalize_course_code."""
+    # 1. Remove all spaces and convert to uppercase
+    clean = course_code.replace(" ", "").upper()
 
-    def normalize_course_code(self, course_code: str) -> str:
-        """
-        Standardizes course codes to 'DEPT ####' format.
-        Example: 'coms4995' -> 'COMS 4995'
-        """
-        # 1. Remove all spaces and convert to uppercase
-        clean = course_code.replace(" ", "").upper()
-
-        # 2. Use regex to separate letters and numbers
-        match = re.match(r"([A-Z]{2,4})(\d{4})", clean)
-        if match:
-            return f"{match.group(1)} {match.group(2)}"
-
-        return course_code  # Return original if pattern doesn't match
-
-    def get_professors_for_course(self, course_code: str, k: int = 5) -> List[Dict[str, Any]]:
-        # 1. Generate variations
-        raw = course_code.strip()
-        no_space = raw.replace(" ", "")
-        with_space = re.sub(r"([A-Z]{2,4})(\d{4})", r"\1 \2", no_space.upper())
-
-        # 2. Build a flexible filter
-        # This checks for: "COMS 4995", "COMS4995", "coms4995", etc.
-        flexible_filter = {
-            "$or": [
-                {"course_code": with_space},           # "COMS 4995"
-                {"course_code": no_space.upper()},     # "COMS4995"
-                {"course_code": no_space.lower()},     # "coms4995"
-                {"course_code": raw}                   # Original input
-            ]
-        }
+    # 2. Use regex to separate letters and numbers
+    match = _COURSE_RE.match(clean)
+    if match:
+        return f"{match.group(1)} {match.group(2)}"
 
-        logger.info(f"Searching with flexible filter for: {raw}")
-        query_embedding = self.embedder.encode_query(f"professors for {with_space}")
+    return course_code  # Return original if pattern doesn't match
 
-        results = self.vector_store.search(
-            query_embedding=query_embedding,
-            k=k * 2,
-            filter_dict=flexible_filter
-        )
 
-        return sorted(results, key=lambda x: x['metadata'].get('rating', 0), reverse=True)[:k]
+@functools.lru_cache(maxsize=2048)
+def _build_course_filter(course_code: str) -> Dict[str, Any]:
+    """
+    Metadata filter matching any spelling of a course code.
+
+    The returned dict is shared between calls and must not be mutated.
+    """
+    variants = list(dict.fromkeys(_course_variants(course_code)))
+    if len(variants) == 1:
+        return {"course_code": variants[0]}
+    return {"$or": [{"course_code": variant} for variant in variants]}
+
+
+@functools.lru_cache(maxsize=4096)
+def _course_variants(course_code: str) -> Tuple[str, str, str, str]:
+    """
+    Spellings of a course code as it may appear in metadata.
+
+    Returns:
+        Tuple of (with_space, no_space_upper, no_space_lower, raw), e.g.
+        ("COMS 4995", "COMS4995", "coms4995", "coms 4995") for " coms 4995"
+    """
+    raw = course_code.strip()
+    no_space = raw.replace(" ", "")
+    with_space = _COURSE_RE.sub(r"\1 \2", no_space.upper())
+    return with_space, no_space.upper(), no_space.lower(), raw
+
 
 class RAGRetriever:
     """
@@ -69,6 +69,13 @@ class RAGRetriever:
     Combines embedding generation and vector search.
     """
 
+    # Approximate words added per document by the citation header and
+    # relevance footer in format_context_for_llm
+    CONTEXT_OVERHEAD_WORDS = 10
+
+    # Formatted contexts kept for repeated retrieval result sets
+    CONTEXT_CACHE_SIZE = 256
+
     def __init__(
         self,
         embedder: EmbeddingGenerator,
@@ -89,6 +96,8 @@ class RAGRetriever:
         self.vector_store = vector_store
         self.top_k = top_k
         self.similarity_threshold = similarity_threshold
+        self._context_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._context_cache_lock = threading.Lock()
         logger.info(f"Initialized RAGRetriever with top_k={top_k}")
 
     def retrieve(
@@ -117,28 +126,69 @@ class RAGRetriever:
         logger.info(f"Retrieving documents for query: {query[:100]}...")
         query_embedding = self.embedder.encode_query(query)
 
-        # Search vector store
-        results = self.vector_store.search(
-            query_embedding=query_embedding,
-            k=k * 2,  # Get more results to filter
-            filter_dict=filter_dict
-        )
+        filtered_results = self._search(query_embedding, k, filter_dict, min_score)
+        logger.info(f"Retrieved {len(filtered_results)} documents above threshold")
+        return filtered_results
 
-        # Filter by similarity threshold
-        filtered_results = []
-        for result in results:
-            # Convert distance to similarity (assuming cosine distance)
-            similarity = 1 - result['distance']
+    def retrieve_many(
+        self,
+        queries: List[str],
+        k: Optional[int] = None,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        min_score: Optional[float] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve documents for several queries at once.
 
-            if similarity >= min_score:
-                result['similarity'] = similarity
-                filtered_results.append(result)
+        All queries are embedded in one batch, then the vector searches
+        run concurrently.
 
-            if len(filtered_results) >= k:
-                break
+        Args:
+            queries: Search query strings
+            k: Number of results per query (overrides default)
+            filter_dict: Optional metadata filters, applied to every query
+            min_score: Minimum similarity score (overrides default)
 
-        logger.info(f"Retrieved {len(filtered_results)} documents above threshold")
-        return filtered_results
+        Returns:
+            One list of retrieved documents per query, in input order
+        """
+        if not queries:
+            return []
+
+        k = k or self.top_k
+        min_score = min_score if min_score is not None else self.similarity_threshold
+
+        logger.info(f"Retrieving documents for {len(queries)} queries")
+        query_embeddings = self.embedder.encode_query_batch(queries)
+
+        with ThreadPoolExecutor(max_workers=min(32, len(queries))) as executor:
+            return list(executor.map(
+                lambda embedding: self._search(embedding, k, filter_dict, min_score),
+                query_embeddings
+            ))
+
+    def _search(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        filter_dict: Optional[Dict[str, Any]],
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """Vector search plus similarity thresholding for one embedding."""
+        # Search vector store. Results come back nearest first and the
+        # store applies the threshold, so k candidates are always enough
+        results = self.vector_store.search(
+            query_embedding=query_embedding,
+            k=k,
+            filter_dict=filter_dict,
+            min_similarity=min_score
+        )
+
+        # Convert distance to similarity (assuming cosine distance)
+        return [
+            dict(result, similarity=1.0 - result['distance'])
+            for result in results
+        ]
 
     def retrieve_with_context(
         self,
@@ -199,12 +249,65 @@ class RAGRetriever:
         if not retrieved_docs:
             return "No relevant information found in the knowledge base."
 
+        # Follow-up questions and the planner often retrieve the same
+        # documents; scores are in the key because the context shows them
+        key = (
+            tuple(
+                (self._context_doc_key(doc), f"{doc.get('similarity', 0):.2f}")
+                for doc in retrieved_docs
+            ),
+            max_context_length,
+        )
+        with self._context_cache_lock:
+            cached = self._context_cache.get(key)
+            if cached is not None:
+                self._context_cache.move_to_end(key)
+                return cached
+
+        context = self._format_context(retrieved_docs, max_context_length)
+
+        with self._context_cache_lock:
+            self._context_cache[key] = context
+            if len(self._context_cache) > self.CONTEXT_CACHE_SIZE:
+                self._context_cache.popitem(last=False)
+
+        return context
+
+    @staticmethod
+    def _context_doc_key(doc: Dict[str, Any]) -> Any:
+        """Identity of a document for the context cache."""
+        if doc.get('id') is not None:
+            return doc['id']
+        metadata = doc['metadata']
+        return (
+            doc['text'],
+            metadata.get('source'),
+            metadata.get('program'),
+            metadata.get('catalog_year'),
+        )
+
+    def _format_context(
+        self,
+        retrieved_docs: List[Dict[str, Any]],
+        max_context_length: int
+    ) -> str:
+        """Uncached body of format_context_for_llm."""
         context_parts = []
         current_length = 0
 
         for i, doc in enumerate(retrieved_docs, 1):
-            # Format document with metadata
             doc_text = doc['text']
+
+            # Estimate the length before formatting anything, so documents
+            # that do not fit are never materialized. The limit is a
+            # budget, so a space count is close enough to a word count
+            doc_length = doc_text.count(" ") + 1 + self.CONTEXT_OVERHEAD_WORDS
+
+            # Check if adding this document exceeds limit
+            if current_length + doc_length > max_context_length:
+                break
+
+            # Format document with metadata
             metadata = doc['metadata']
             similarity = doc.get('similarity', 0)
 
@@ -213,18 +316,11 @@ class RAGRetriever:
             program = metadata.get('program', '')
             catalog_year = metadata.get('catalog_year', '')
 
-            doc_header = f"\n[Source {i}: {program} {catalog_year} - {source}]"
-            doc_content = f"\n{doc_text}\n"
-            doc_footer = f"[Relevance Score: {similarity:.2f}]"
-
-            doc_formatted = doc_header + doc_content + doc_footer
-            doc_length = len(doc_formatted.split())
-
-            # Check if adding this document exceeds limit
-            if current_length + doc_length > max_context_length:
-                break
-
-            context_parts.append(doc_formatted)
+            context_parts.append(
+                f"\n[Source {i}: {program} {catalog_year} - {source}]"
+                f"\n{doc_text}\n"
+                f"[Relevance Score: {similarity:.2f}]"
+            )
             current_length += doc_length
 
         context = "\n---\n".join(context_parts)
@@ -233,6 +329,118 @@ class RAGRetriever:
         return preamble + context
 
 
+class SemanticResponseCache:
+    """
+    Cache of LLM answers keyed by query embedding.
+
+    Paraphrases of an earlier question ("CS core courses?" vs "what are
+    the core CS courses") land close together in embedding space, so a
+    new query whose cosine similarity to a cached one clears the
+    threshold reuses that answer instead of calling the LLM again.
+    Queries that differ in a single token (e.g. two course numbers) can
+    embed just as close, so callers should namespace entries by whatever
+    the answer depends on, such as the retrieved documents.
+    """
+
+    def __init__(
+        self,
+        embedder: EmbeddingGenerator,
+        threshold: float = 0.95,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = 3600
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            embedder: Embedding generator used to embed queries (normally
+                the retriever's, so no extra model is loaded)
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Entries kept before the oldest are overwritten
+            ttl_seconds: Seconds an entry stays valid; None keeps entries
+                until they are overwritten or cleared
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # One preallocated (max, dim) matrix so lookup is a single gemv
+        self._matrix: Optional[np.ndarray] = None
+        self._namespaces: List[Optional[str]] = [None] * max_entries
+        self._values: List[Any] = [None] * max_entries
+        self._expires = np.full(max_entries, np.inf)
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _embed(self, query: str) -> np.ndarray:
+        embedding = np.asarray(self.embedder.encode_query(query), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def lookup(self, query: str, namespace: str = "") -> Optional[Any]:
+        """
+        Find a cached answer for a semantically similar query.
+
+        Args:
+            query: Query string
+            namespace: Only entries stored under the same namespace match
+                (e.g. a serialized user profile)
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        embedding = self._embed(query)
+        with self._lock:
+            if self._count == 0:
+                return None
+            sims = self._matrix[:self._count] @ embedding
+            now = time.monotonic()
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                if self._namespaces[i] == namespace and self._expires[i] > now:
+                    logger.info(f"Semantic cache hit (similarity={sims[i]:.3f})")
+                    return self._values[i]
+        return None
+
+    def add(self, query: str, value: Any, namespace: str = ""):
+        """
+        Store an answer for a query.
+
+        Args:
+            query: Query string
+            value: Value to return for similar queries
+            namespace: Namespace the entry belongs to
+        """
+        embedding = self._embed(query)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._matrix[slot] = embedding
+            self._namespaces[slot] = namespace
+            self._values[slot] = value
+            self._expires[slot] = (
+                np.inf if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+            )
+            self._next = (slot + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+    def clear(self):
+        """Drop all cached entries."""
+        with self._lock:
+            self._namespaces = [None] * self.max_entries
+            self._values = [None] * self.max_entries
+            self._expires.fill(np.inf)
+            self._count = 0
+            self._next = 0
+
+
 class ProfessorRatingsRetriever:
     """
     Specialized retriever for professor ratings.
@@ -254,6 +462,19 @@ class ProfessorRatingsRetriever:
         self.vector_store = vector_store
         logger.info("Initialized ProfessorRatingsRetriever")
 
+    def normalize_course_code(self, course_code: str) -> str:
+        """
+        Standardize a course code to 'DEPT ####' format.
+
+        Args:
+            course_code: Course code in any spelling (e.g., "coms4995")
+
+        Returns:
+            Normalized course code (e.g., "COMS 4995"), or the input
+            unchanged if it does not look like a course code
+        """
+        return _normalize_course_code(course_code)
+
     def get_professors_for_course(
         self,
         course_code: str,
@@ -269,14 +490,24 @@ class ProfessorRatingsRetriever:
         Returns:
             List of professor rating records sorted by rating
         """
-        # Search with course code filter
-        query = f"professors teaching {course_code}"
+        # Search with course code filter. The query uses the normalized
+        # code so every spelling of a course shares one cached embedding
+        query = f"professors teaching {self.normalize_course_code(course_code)}"
         query_embedding = self.embedder.encode_query(query)
 
+        return self._search_course(course_code, query_embedding, k)
+
+    def _search_course(
+        self,
+        course_code: str,
+        query_embedding: np.ndarray,
+        k: int
+    ) -> List[Dict[str, Any]]:
+        """Search one course's professors with a precomputed embedding."""
         results = self.vector_store.search(
             query_embedding=query_embedding,
             k=k * 2,
-            filter_dict={'course_code': course_code}
+            filter_dict=_build_course_filter(course_code)
         )
 
         # Sort by rating (highest first)
@@ -306,22 +537,38 @@ class ProfessorRatingsRetriever:
 
     def get_professors_for_courses(
         self,
-        course_codes: List[str]
+        course_codes: List[str],
+        k: int = 5
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Get professors for multiple courses.
 
+        All queries are embedded in one batch, then the per-course vector
+        searches run concurrently.
+
         Args:
             course_codes: List of course codes
+            k: Number of professors per course
 
         Returns:
             Dictionary mapping course codes to professor lists
         """
-        result = {}
-        for course_code in course_codes:
-            professors = self.get_professors_for_course(course_code)
-            result[course_code] = professors
-        return result
+        course_codes = list(dict.fromkeys(course_codes))
+        if not course_codes:
+            return {}
+
+        queries = [
+            f"professors teaching {_normalize_course_code(course_code)}"
+            for course_code in course_codes
+        ]
+        query_embeddings = self.embedder.encode_query_batch(queries)
+
+        with ThreadPoolExecutor(max_workers=min(32, len(course_codes))) as executor:
+            professors = executor.map(
+                lambda args: self._search_course(*args, k),
+                zip(course_codes, query_embeddings)
+            )
+            return dict(zip(course_codes, professors))
 
     def format_professor_info(
         self,
@@ -4,14 +4,73 @@ Vector database module for storing and retrieving embeddings
 
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+import functools
 import numpy as np
 import logging
 import json
 import pickle
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# One Chroma client per persist directory, shared by every collection
+_chroma_clients: Dict[str, Any] = {}
+_chroma_clients_lock = threading.Lock()
+
+
+def _get_chroma_client(persist_directory: str):
+    """
+    Return the shared Chroma client for a persist directory, creating it
+    on first use. Safe to call from concurrent startup threads.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    key = str(Path(persist_directory).resolve())
+    with _chroma_clients_lock:
+        client = _chroma_clients.get(key)
+        if client is None:
+            client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=Settings(anonymized_telemetry=False)
+            )
+            _chroma_clients[key] = client
+        return client
+
+
+def _dumps_json(value: Any) -> str:
+    """JSON-encode a metadata value, with orjson's C encoder when installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(value)
+
+
+@functools.lru_cache(maxsize=512)
+def _build_where_clause(filter_items: Tuple[Tuple[str, Any], ...]) -> Dict[str, Any]:
+    """Chroma where clause for sorted (key, value) filter items. Cached; do not mutate."""
+    items = [{k: v} for k, v in filter_items]
+    if len(items) == 1:
+        return items[0]
+    return {"$and": items}
+
+
+def _where_clause(filter_dict: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Chroma where clause for a metadata filter, or None without one."""
+    if not filter_dict:
+        return None
+    filter_items = tuple(sorted(filter_dict.items()))
+    try:
+        return _build_where_clause(filter_items)
+    except TypeError:
+        # Unhashable operator values, e.g. {"$in": [...]}; build uncached
+        return _build_where_clause.__wrapped__(filter_items)
+
 
 class VectorStore:
     """Base class for vector stores."""
@@ -36,9 +95,14 @@ class VectorStore:
         self,
         query_embedding: np.ndarray,
         k: int = 5,
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        min_similarity: Optional[float] = None
     ) -> List[Dict[str, Any]]:
-        """Search for similar documents."""
+        """
+        Search for similar documents. Results are nearest first; with
+        min_similarity, those whose similarity (1 - distance) falls below
+        it are left out.
+        """
         raise NotImplementedError
 
     def delete_collection(self):
@@ -49,10 +113,17 @@ class VectorStore:
 class ChromaVectorStore(VectorStore):
     """Vector store using ChromaDB."""
 
+    # Rows per collection.add call, to cap peak memory on large ingests
+    # (further capped by the client's own maximum batch size)
+    ADD_BATCH_SIZE = 10_000
+
     def __init__(
         self,
         collection_name: str,
-        persist_directory: str = "./vector_db"
+        persist_directory: str = "./vector_db",
+        hnsw_m: int = 24,
+        ef_construction: int = 128,
+        ef_search: int = 100
     ):
         """
         Initialize ChromaDB vector store.
@@ -60,30 +131,55 @@ class ChromaVectorStore(VectorStore):
         Args:
             collection_name: Name of the collection
             persist_directory: Directory to persist the database
+            hnsw_m: HNSW graph degree (links per node)
+            ef_construction: HNSW candidate list size while building
+            ef_search: HNSW candidate list size while querying; higher
+                trades latency for recall
+
+        The HNSW parameters only take effect when the collection is
+        created; an existing collection keeps the ones it was built with.
         """
         try:
             import chromadb
-            from chromadb.config import Settings
         except ImportError:
             raise ImportError("chromadb not installed. Run: pip install chromadb")
 
         self.persist_directory = persist_directory
         Path(persist_directory).mkdir(parents=True, exist_ok=True)
 
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(anonymized_telemetry=False)
-        )
+        self.client = _get_chroma_client(persist_directory)
 
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+            metadata={
+                "hnsw:space": "cosine",
+                "hnsw:M": hnsw_m,
+                "hnsw:construction_ef": ef_construction,
+                "hnsw:search_ef": ef_search,
+            }
         )
 
+        # Metadata keys whose values were JSON-encoded on add, so search
+        # decodes only those. Kept in a sidecar file: modifying collection
+        # metadata would replace the hnsw:* settings. None for collections
+        # written before the file existed, which probe every value
+        self._json_keys_path = Path(persist_directory) / f"{collection_name}.json_keys.json"
+        self._json_keys = self._load_json_keys()
+
         logger.info(f"Initialized ChromaDB collection: {collection_name}")
         logger.info(f"Current document count: {self.collection.count()}")
 
+    def _load_json_keys(self) -> Optional[set]:
+        """Read the set of JSON-encoded metadata keys for this collection."""
+        if self._json_keys_path.exists():
+            with open(self._json_keys_path, "r") as f:
+                return set(json.load(f))
+        return None if self.collection.count() else set()
+
+    def _save_json_keys(self):
+        with open(self._json_keys_path, "w") as f:
+            json.dump(sorted(self._json_keys), f)
 
     def add_documents(
         self,
@@ -97,33 +193,46 @@ class ChromaVectorStore(VectorStore):
 
         Args:
             texts: List of text strings
-            embeddings: Numpy array of embeddings
+            embeddings: Numpy array of embeddings, ideally C-contiguous
+                float32 (as EmbeddingGenerator returns); anything else is
+                converted once
             metadatas: List of metadata dictionaries
             ids: Optional list of document IDs
         """
         if ids is None:
             ids = [f"doc_{i}" for i in range(len(texts))]
 
-        # Convert numpy array to list for ChromaDB
-        embeddings_list = embeddings.tolist() if isinstance(embeddings, np.ndarray) else embeddings
+        # ChromaDB accepts ndarrays directly; one contiguous float32 array
+        # avoids materializing N*D Python floats via tolist()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
 
         # ChromaDB requires metadata values to be strings, ints, or floats
         processed_metadatas = []
+        json_keys = set()
         for metadata in metadatas:
             processed = {}
             for key, value in metadata.items():
-                if isinstance(value, (list, dict)):
-                    processed[key] = json.dumps(value)
+                if isinstance(value, (list, tuple, dict)):
+                    processed[key] = _dumps_json(value)
+                    json_keys.add(key)
                 else:
                     processed[key] = value
             processed_metadatas.append(processed)
 
-        self.collection.add(
-            documents=texts,
-            embeddings=embeddings_list,
-            metadatas=processed_metadatas,
-            ids=ids
-        )
+        batch_size = min(self.ADD_BATCH_SIZE, self.client.get_max_batch_size())
+        for start in range(0, len(texts), batch_size):
+            end = start + batch_size
+            self.collection.add(
+                documents=texts[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=processed_metadatas[start:end],
+                ids=ids[start:end]
+            )
+
+        # A legacy collection (None) stays on the probing path
+        if self._json_keys is not None and not json_keys <= self._json_keys:
+            self._json_keys |= json_keys
+            self._save_json_keys()
 
         logger.info(f"Added {len(texts)} documents to ChromaDB")
 
@@ -134,7 +243,8 @@ class ChromaVectorStore(VectorStore):
         self,
         query_embedding: np.ndarray,
         k: int = 5,
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        min_similarity: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """
         Search for similar documents in ChromaDB.
@@ -143,35 +253,34 @@ class ChromaVectorStore(VectorStore):
             query_embedding: Query embedding vector
             k: Number of results to return
             filter_dict: Optional metadata filter
+            min_similarity: Optional minimum similarity (1 - distance);
+                results below it are dropped before they are formatted
 
         Returns:
             List of result dictionaries with text, metadata, and distance
         """
         query_embedding_list = query_embedding.tolist() if isinstance(query_embedding, np.ndarray) else query_embedding
 
-        # Build where clause for filtering
-        where_clause = None
-        if filter_dict:
-            items = [{k: v} for k, v in filter_dict.items()]
-            if len(items) == 1:
-                where_clause = items[0]
-            else:
-                where_clause = {"$and": items}
-
         results = self.collection.query(
             query_embeddings=[query_embedding_list],
             n_results=k,
-            where=where_clause
+            where=_where_clause(filter_dict)
         )
 
-        # Format results
+        # Format results. Chroma returns nearest first, so everything
+        # after the first result below the threshold is below it as well
         formatted_results = []
         if results['documents'][0]:
             for i in range(len(results['documents'][0])):
+                if min_similarity is not None and 1 - results['distances'][0][i] < min_similarity:
+                    break
                 metadata = results['metadatas'][0][i]
-                # Parse JSON strings back to objects
-                for key, value in metadata.items():
-                    if isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
+                # Parse JSON strings back to objects, only for the keys
+                # that were encoded on add
+                json_keys = metadata.keys() if self._json_keys is None else self._json_keys & metadata.keys()
+                for key in json_keys:
+                    value = metadata[key]
+                    if isinstance(value, str) and value[:1] in ('[', '{'):
                         try:
                             metadata[key] = json.loads(value)
                         except:
@@ -189,6 +298,7 @@ class ChromaVectorStore(VectorStore):
     def delete_collection(self):
         """Delete the collection."""
         self.client.delete_collection(self.collection.name)
+        self._json_keys_path.unlink(missing_ok=True)
         logger.info(f"Deleted collection: {self.collection.name}")
 
 